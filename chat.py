@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
-import os, uuid
-from fastapi import APIRouter, Form, HTTPException, Depends, Request, Response
+import os
+import uuid_utils
+from fastapi import APIRouter, BackgroundTasks, Form, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import SessionLocal, save_rows
 from models import Chat
 from datetime import datetime, timedelta
-from rag_engine import get_answer
+from rag_engine import aget_answer, stream_answer
 
 router = APIRouter(prefix="/chat")
 
@@ -21,7 +23,7 @@ def get_db():
 def get_or_create_session(request: Request, response: Response):
     session_id = request.cookies.get("session_id")
     if not session_id:
-        session_id = str(uuid.uuid4())
+        session_id = str(uuid_utils.uuid7())  # Time-ordered, so new sessions append to the index
         response.set_cookie(
             key="session_id",
             value=session_id,
@@ -68,6 +70,7 @@ def build_prompt(db, session_id, user_message, context_limit=10):
 async def chat_main(
     request: Request,
     response: Response,
+    background_tasks: BackgroundTasks,
     text: str = Form(...),
     user_id: str = Form("default_user"),
     db: Session = Depends(get_db)
@@ -80,7 +83,7 @@ async def chat_main(
         session_id = get_or_create_session(request, response)
 
         # Get AI response using RAG
-        ai_text = get_answer(
+        ai_text = await aget_answer(
             question=text,
             session_id=session_id,
             db_session=db
@@ -88,7 +91,7 @@ async def chat_main(
 
 
 
-        # Save to database
+        # Save to database after the response is sent
         new_chat = Chat(
             session_id=session_id,
             user_id=user_id,
@@ -96,9 +99,7 @@ async def chat_main(
             answer=ai_text,
             created_at=datetime.utcnow()
         )
-        db.add(new_chat)
-        db.commit()
-        db.refresh(new_chat)
+        background_tasks.add_task(save_rows, new_chat)
 
         return {
             "message": ai_text,
@@ -112,8 +113,52 @@ async def chat_main(
         raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
 
 
+@router.post("/stream")
+async def chat_stream(
+    request: Request,
+    response: Response,
+    text: str = Form(...),
+    user_id: str = Form("default_user")
+):
+    """
+    Streaming chat endpoint - sends the answer as plain text chunks
+    while Gemini is still generating it
+    """
+    session_id = get_or_create_session(request, response)
+
+    def generate():
+        # Own session: the request-scoped one may close before streaming ends
+        db = SessionLocal()
+        try:
+            parts = []
+            for chunk in stream_answer(question=text, session_id=session_id, db_session=db):
+                parts.append(chunk)
+                yield chunk
+
+            db.add(Chat(
+                session_id=session_id,
+                user_id=user_id,
+                question=text,
+                answer="".join(parts).strip(),
+                created_at=datetime.utcnow()
+            ))
+            db.commit()
+        except Exception as e:
+            print("❌ Stream Error:", str(e))
+            db.rollback()
+        finally:
+            db.close()
+
+    streaming = StreamingResponse(generate(), media_type="text/plain; charset=utf-8")
+    if "set-cookie" in response.headers:
+        streaming.headers["set-cookie"] = response.headers["set-cookie"]
+    return streaming
+
+
+# Plain def: FastAPI runs it in the threadpool, so the blocking query
+# doesn't stall the event loop
 @router.get("/history/{user_id}")
-async def get_chat_history(
+def get_chat_history(
     user_id: str,
     request: Request,
     db: Session = Depends(get_db),
@@ -0,0 +1,38 @@
+import os
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use: the affinity mask, capped by the
+    cgroup CPU quota (os.cpu_count() reports the host's cores in containers)
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:  # cgroup v1
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0:
+                cpus = min(cpus, max(1, quota // period))
+        except (OSError, ValueError):
+            pass
+
+    return cpus
+
+
+# Half the cores per encode leaves room for concurrent requests. OpenMP and
+# BLAS read these once, when numpy, faiss or torch first loads them, so entry
+# points import this module before anything else
+EMBEDDINGS_NUM_THREADS = int(os.getenv("EMBEDDINGS_NUM_THREADS", max(1, available_cpus() // 2)))
+os.environ.setdefault("OMP_NUM_THREADS", str(EMBEDDINGS_NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(EMBEDDINGS_NUM_THREADS))
@@ -1,29 +1,22 @@
-import json
+import cpu_threads  # Thread limits must be in the environment before numpy/faiss/torch load
+import orjson
 import os
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-import re
+from embeddings import get_embeddings, embed_corpus
+from vector_index import to_hnsw, DISTANCE_STRATEGY
+from scraper import PHONE_RES, EMAIL_RE
 
 def extract_contact_info(text):
     """Extract contact information from text"""
     contacts = []
     
-    # Phone patterns
-    phone_patterns = [
-        r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}',
-        r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}\s*(?:ext|x|extension)?\s*\d*',
-    ]
-    
-    # Email pattern
-    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-    
-    for pattern in phone_patterns:
-        phones = re.findall(pattern, text)
+    for pattern in PHONE_RES:
+        phones = pattern.findall(text)
         if phones:
             contacts.extend([f"📞 Phone: {phone}" for phone in phones])
     
-    emails = re.findall(email_pattern, text)
+    emails = EMAIL_RE.findall(text)
     if emails:
         contacts.extend([f"✉️ Email: {email}" for email in emails])
     
@@ -40,8 +33,8 @@ def create_vectorstore():
         print("❌ No scraped data found! Run scraper.py first.")
         return
     
-    with open('data/scraped_data.json', 'r', encoding='utf-8') as f:
-        pages = json.load(f)
+    with open('data/scraped_data.json', 'rb') as f:
+        pages = orjson.loads(f.read())
     
     print(f"✅ Loaded {len(pages)} pages")
     
@@ -111,23 +104,21 @@ def create_vectorstore():
         "all_chunks": chunks  # All chunks
     }
     
-    with open('data/chunks.json', 'w', encoding='utf-8') as f:
-        json.dump(chunks_data, f, ensure_ascii=False, indent=2)
+    with open('data/chunks.json', 'wb') as f:
+        f.write(orjson.dumps(chunks_data, option=orjson.OPT_INDENT_2))
     
     print(f"✅ Chunks saved to: data/chunks.json")
     
     # 5. Create embeddings
     print("\n🔧 Creating embeddings model...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    embeddings = get_embeddings()
     print("✅ Embeddings model ready")
     
     # 6. Create FAISS vector store
     print("\n🧠 Creating FAISS vector store...")
-    vectorstore = FAISS.from_texts(chunks, embeddings)
+    vectors = embed_corpus(chunks)
+    vectorstore = FAISS.from_embeddings(list(zip(chunks, vectors)), embeddings, distance_strategy=DISTANCE_STRATEGY)
+    vectorstore.index = to_hnsw(vectorstore.index)
     
     # 7. Save vector store
     print("\n💾 Saving vector store...")
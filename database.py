@@ -61,3 +61,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def save_rows(*rows):
+    """
+    Commit rows in a session of their own. For BackgroundTasks, which run after
+    the response is sent and after the request's get_db session is closed.
+    """
+    if SessionLocal is None:
+        return
+
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception as e:
+        logger.error(f"❌ Failed to save rows: {e}")
+        db.rollback()
+    finally:
+        db.close()
@@ -0,0 +1,306 @@
+import os
+import hashlib
+import logging
+import sqlite3
+from contextlib import closing
+from functools import lru_cache
+from typing import List
+
+# Seeds the thread env before numpy is imported below
+from cpu_threads import available_cpus, EMBEDDINGS_NUM_THREADS
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_CACHE = os.getenv("MODEL_CACHE")  # /app/model_cache in the container
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "onnx")  # "onnx", "ct2" or "torch"
+# Dynamic int8 export shipped in the model repo; runs VNNI int8 dot products
+# where available and plain AVX2 int8 kernels elsewhere
+ONNX_FILE_NAME = os.getenv("EMBEDDINGS_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+FORCE_CPU = os.getenv("RAG_FORCE_CPU") == "1"  # For containers without the NVIDIA runtime
+GPU_BATCH_SIZE = 64
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+# Chunk vectors kept across ingest runs, keyed by content hash; "" disables
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "data/embed_cache.sqlite")
+
+
+class CTranslate2Embeddings(Embeddings):
+    """MiniLM sentence encoder running as a quantized CTranslate2 model"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, compute_type: str = "int8", device: str = "cpu"):
+        from hf_hub_ctranslate2 import CT2SentenceTransformer
+
+        self.model = CT2SentenceTransformer(
+            model_name,
+            compute_type=compute_type,
+            device=device,
+            cache_folder=MODEL_CACHE
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            list(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _ct2_device():
+    """Pick CTranslate2 device and compute type (int8 GEMM on CPU, int8/fp16 on GPU)"""
+    import ctranslate2
+
+    if not FORCE_CPU and ctranslate2.get_cuda_device_count() > 0:
+        return "cuda", "int8_float16"
+    return "cpu", "int8"
+
+
+def _ct2_embeddings() -> Embeddings:
+    device, compute_type = _ct2_device()
+    embeddings = CTranslate2Embeddings(compute_type=compute_type, device=device)
+    logger.info("✅ CTranslate2 embeddings ready (%s on %s)", compute_type, device)
+    return embeddings
+
+
+def _onnx_session_options():
+    """ONNX Runtime session with full graph optimization (op fusion, constant folding)"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = EMBEDDINGS_NUM_THREADS  # Same budget as torch; FAISS keeps the rest
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+class OnnxSentenceEncoder:
+    """
+    MiniLM exported to ONNX, run directly on ONNX Runtime with the model's
+    fast tokenizer: mean pooling over the attention mask, as sentence-transformers does
+    """
+
+    MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2's sentence-transformers limit
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, file_name: str = ONNX_FILE_NAME):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        model_path = hf_hub_download(model_name, file_name, cache_dir=MODEL_CACHE)
+        tokenizer_path = hf_hub_download(model_name, "tokenizer.json", cache_dir=MODEL_CACHE)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=_onnx_session_options(),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Similar lengths per batch keep padding (and wasted compute) small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = self._encode_batch([texts[i] for i in rows])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain wrapper around OnnxSentenceEncoder"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, file_name: str = ONNX_FILE_NAME):
+        self.model = OnnxSentenceEncoder(model_name, file_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _onnx_embeddings() -> Embeddings:
+    embeddings = OnnxEmbeddings()
+    logger.info("✅ ONNX Runtime embeddings ready (%s)", ONNX_FILE_NAME)
+    return embeddings
+
+
+def _configure_torch():
+    """Size torch's thread pools so concurrent encodes don't oversubscribe the CPU"""
+    import torch
+
+    torch.set_num_threads(EMBEDDINGS_NUM_THREADS)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        pass  # Can only be set once, before any inter-op work has run
+
+
+def _torch_device():
+    """CUDA when a GPU is visible and not disabled via RAG_FORCE_CPU"""
+    import torch
+
+    if not FORCE_CPU and torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+def _torch_embeddings() -> Embeddings:
+    _configure_torch()
+    device = _torch_device()
+    encode_kwargs = {'normalize_embeddings': True}
+    if device == "cuda":
+        encode_kwargs.update({'batch_size': GPU_BATCH_SIZE, 'convert_to_tensor': False})
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        cache_folder=MODEL_CACHE,
+        model_kwargs={'device': device},
+        encode_kwargs=encode_kwargs
+    )
+
+    # Inference only: no dropout, no autograd bookkeeping on the weights
+    embeddings.client.eval()
+    for param in embeddings.client.parameters():
+        param.requires_grad_(False)
+
+    logger.info("✅ PyTorch embeddings ready on %s (%d threads)", device, EMBEDDINGS_NUM_THREADS)
+    return embeddings
+
+
+_BACKENDS = {
+    "ct2": _ct2_embeddings,
+    "onnx": _onnx_embeddings,
+    "torch": _torch_embeddings,
+}
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> Embeddings:
+    """
+    Return the shared embeddings model.
+    Cached so the vector store and every query use the same instance.
+    """
+    loader = _BACKENDS.get(EMBEDDINGS_BACKEND, _torch_embeddings)
+    if loader is not _torch_embeddings:
+        try:
+            return loader()
+        except (ImportError, OSError):
+            # Missing package or model file; anything else is a bug and should surface
+            logger.error("❌ %s embeddings unavailable, falling back to PyTorch", EMBEDDINGS_BACKEND, exc_info=True)
+
+    return _torch_embeddings()
+
+
+def loaded_backend() -> str:
+    """Name of the backend get_embeddings() actually loaded, which may be the PyTorch fallback"""
+    return {OnnxEmbeddings: "onnx", CTranslate2Embeddings: "ct2"}.get(type(get_embeddings()), "torch")
+
+
+def require_configured_backend():
+    """
+    Load the embeddings and raise if EMBEDDINGS_BACKEND fell back to PyTorch.
+    The image build runs this so a broken backend fails the build.
+    """
+    loaded = loaded_backend()
+    if loaded != EMBEDDINGS_BACKEND:
+        raise RuntimeError(f"EMBEDDINGS_BACKEND={EMBEDDINGS_BACKEND} but the {loaded} backend loaded")
+    logger.info("✅ Embeddings backend verified: %s", loaded)
+
+
+def _encode_corpus(texts: List[str], batch_size: int) -> np.ndarray:
+    # Calls the encoder directly so the batch size isn't capped by the
+    # query-time encode_kwargs
+    embeddings = get_embeddings()
+    encoder = embeddings.model if isinstance(embeddings, (CTranslate2Embeddings, OnnxEmbeddings)) else embeddings.client
+    return encoder.encode(
+        texts,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    ).astype(np.float32)
+
+
+def _cache_tag() -> str:
+    # Vectors differ between backends and model files, so they are part of the
+    # key: the backend that loaded, not the configured one, and the ONNX file
+    # only when it is the one encoding
+    backend = loaded_backend()
+    return f"{EMBEDDING_MODEL}|{backend}|{ONNX_FILE_NAME}" if backend == "onnx" else f"{EMBEDDING_MODEL}|{backend}"
+
+
+def _cache_key(tag: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{tag}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+def embed_corpus(texts: List[str], batch_size: int = INGEST_BATCH_SIZE,
+                 cache_path: str = EMBED_CACHE_PATH) -> List[List[float]]:
+    """
+    Embed a whole corpus in large batches for ingestion.
+    Chunks already embedded by an earlier run are read back from the
+    SQLite cache at cache_path; only new or changed chunks are encoded.
+    """
+    texts = list(texts)
+    if not cache_path:
+        return _encode_corpus(texts, batch_size).tolist()
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tag = _cache_tag()
+    keys = [_cache_key(tag, text) for text in texts]
+
+    with closing(sqlite3.connect(cache_path)) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS vectors (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+
+        cached = {}
+        for start in range(0, len(keys), 500):  # Stay under SQLite's bound-parameter limit
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cached.update(conn.execute(f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch))
+
+        misses = {}  # key -> text, deduplicated in corpus order
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                misses.setdefault(key, text)
+
+        logger.info("🧮 Embedding cache: %d hits, %d to encode", len(texts) - len(misses), len(misses))
+        if misses:
+            vectors = _encode_corpus(list(misses.values()), batch_size)
+            rows = [(key, vector.tobytes()) for key, vector in zip(misses, vectors)]
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)", rows)
+            cached.update(rows)
+
+    return [np.frombuffer(cached[key], dtype=np.float32).tolist() for key in keys]
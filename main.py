@@ -1,19 +1,22 @@
+import cpu_threads  # Thread limits must be in the environment before numpy/faiss/torch load
+import asyncio
 import logging
 import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 from chat import router as chat_router
-from voice_chat import router as voice_router
-from rag_engine import start_loading_vectorstore, initialize_gemini
+from voice_chat import router as voice_router, warm_up_voice, MAX_AUDIO_BYTES
+from rag_engine import start_loading_vectorstore, initialize_gemini, warm_up_gemini
 
 # App Initialization
 app = FastAPI(
     title="Primis Digital Support AI Bot",
     description="RAG-based AI chatbot with voice support",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse  # orjson encodes returned dicts
 )
 
 # Logging Configuration
@@ -23,6 +26,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class VoiceUploadLimit:
+    """
+    Refuse voice uploads whose Content-Length is over the limit before the body
+    is read; FastAPI parses the whole form before the endpoint can check it
+    """
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/voice"):
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes:
+                response = ORJSONResponse(status_code=413, content={"detail": "Audio file too large"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so the 413 still carries CORS headers; the slack covers
+# the multipart boundaries and form fields around the audio
+app.add_middleware(VoiceUploadLimit, max_bytes=MAX_AUDIO_BYTES + 64 * 1024)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -42,15 +67,19 @@ async def startup_tasks():
     logger.info(f"Python version: {os.sys.version}")
     logger.info(f"PORT: {os.getenv('PORT', '8080')}")
     
+    # Initialize RAG system (background download overlaps the steps below)
+    logger.info("📚 Starting RAG system...")
+    start_loading_vectorstore()
+    
     # Initialize Gemini
     logger.info("🤖 Initializing Gemini AI...")
     gemini_initialized = initialize_gemini()
     if not gemini_initialized:
         logger.error("❌ Failed to initialize Gemini - some features may not work")
-    
-    # Initialize RAG system
-    logger.info("📚 Starting RAG system...")
-    start_loading_vectorstore()
+    else:
+        # In the background so startup doesn't wait on the round trip
+        app.state.gemini_warm_up = asyncio.create_task(warm_up_gemini())
+        app.state.voice_warm_up = asyncio.create_task(warm_up_voice())
     
     # Initialize Database
     try:
@@ -59,6 +88,9 @@ async def startup_tasks():
         
         if engine is not None:
             Base.metadata.create_all(bind=engine)
+            # create_all skips existing tables; add indexes introduced since
+            for index in models.Chat.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
             logger.info("✅ Database tables synchronized")
         else:
             logger.warning("⚠️ Database engine not initialized - running without persistence")
@@ -88,6 +120,7 @@ async def root():
         "version": "2.0.0",
         "endpoints": {
             "chat": "/chat/",
+            "chat_stream": "/chat/stream",
             "chat_history": "/chat/history/{user_id}",
             "voice_chat": "/voice/",
             "health": "/health",
@@ -101,7 +134,7 @@ async def root():
 async def global_exception_handler(request, exc):
     """Global exception handler"""
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
@@ -0,0 +1,106 @@
+import os
+import mmap
+import pickle
+import logging
+
+import numpy as np
+import orjson
+import xxhash
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+logger = logging.getLogger(__name__)
+
+# Cache layout: documents as concatenated JSON records plus row offsets
+DATA_FILE = "docs.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.npy"
+STAMP_FILE = "source.xxh"  # Hash of the index.pkl the cache was built from
+
+
+class MmapDocstore(Docstore):
+    """Read-only docstore that decodes documents on demand from a memory-mapped file"""
+
+    def __init__(self, path: str):
+        self.ids = [str(doc_id) for doc_id in np.load(os.path.join(path, IDS_FILE))]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+
+        with open(os.path.join(path, DATA_FILE), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.ids else b""
+
+    def search(self, search: str):
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return Document(**orjson.loads(self._data[start:end]))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """xxh3 hex digest of a file, read in chunks"""
+    digest = xxhash.xxh3_64()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_stamp(path):
+    try:
+        with open(os.path.join(path, STAMP_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_docstore(path, docstore, index_to_docstore_id, source_hash):
+    """Serialize a docstore in FAISS row order for MmapDocstore"""
+    os.makedirs(path, exist_ok=True)
+    stamp_file = os.path.join(path, STAMP_FILE)
+    if os.path.exists(stamp_file):
+        os.remove(stamp_file)  # Invalidate while rewriting
+
+    ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+    offsets = [0]
+    with open(os.path.join(path, DATA_FILE), "wb") as f:
+        for doc_id in ids:
+            doc = docstore.search(doc_id)
+            record = {"page_content": doc.page_content, "metadata": doc.metadata}
+            if doc.id:
+                record["id"] = doc.id
+            f.write(orjson.dumps(record))
+            offsets.append(f.tell())
+
+    np.save(os.path.join(path, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(path, IDS_FILE), np.asarray(ids, dtype=str))
+
+    with open(stamp_file, "w") as f:
+        f.write(source_hash)
+
+
+def load_docstore(pkl_path, cache_path):
+    """
+    Return (docstore, index_to_docstore_id) for a saved FAISS store.
+    Uses the mmap cache when it was built from this index.pkl, otherwise
+    unpickles and writes the cache for the next start.
+    """
+    source_hash = file_hash(pkl_path)
+
+    if _read_stamp(cache_path) == source_hash:
+        try:
+            docstore = MmapDocstore(cache_path)
+            logger.info("🗺️  Docstore mapped from cache (%d documents)", len(docstore.ids))
+            return docstore, dict(enumerate(docstore.ids))
+        except Exception as e:
+            logger.warning("⚠️ Docstore cache unreadable, falling back to index.pkl: %s", e)
+
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    try:
+        write_docstore(cache_path, docstore, index_to_docstore_id, source_hash)
+    except (OSError, AttributeError, TypeError) as e:
+        logger.warning("⚠️ Could not write docstore cache: %s", e)
+
+    return docstore, index_to_docstore_id
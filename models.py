@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
 from database import Base
 from datetime import datetime
 
@@ -11,3 +11,8 @@ class Chat(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    # History lookups filter on session and order by time
+    __table_args__ = (
+        Index("ix_chat_session_created", "session_id", "created_at"),
+    )
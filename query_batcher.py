@@ -0,0 +1,127 @@
+import abc
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _MicroBatcher(abc.ABC):
+    """
+    Collects work items from concurrent callers and hands them to _run in
+    batches of up to max_batch, waiting at most max_wait_ms for a batch to fill.
+    Items are grouped by their first element so each _run sees one target.
+    """
+
+    def __init__(self, max_batch: int = 16, max_wait_ms: float = 20, timeout: float = 30):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout  # Callers give up rather than block on a stuck batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _submit(self, *args):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((*args, future))
+        return future.result(timeout=self.timeout)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        # Nothing may escape this loop: a dead worker is never restarted
+        while True:
+            batch = [self._queue.get()]
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error("❌ %s worker error", type(self).__name__, exc_info=True)
+                self._fail(batch, e)
+
+    def _process(self, batch):
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # The target (e.g. the index) can be swapped on reload; run each one separately
+        by_target = {}
+        for item in batch:
+            by_target.setdefault(id(item[0]), []).append(item)
+
+        for items in by_target.values():
+            try:
+                self._run(items)
+            except Exception as e:
+                logger.error("❌ Batched %s call failed", type(self).__name__, exc_info=True)
+                self._fail(items, e)
+
+    @staticmethod
+    def _fail(items, error):
+        # _run may have resolved some futures before raising
+        for item in items:
+            if not item[-1].done():
+                item[-1].set_exception(error)
+
+    @abc.abstractmethod
+    def _run(self, items):
+        """Process one batch of items sharing a target, resolving each item's future"""
+
+
+class QueryBatcher(_MicroBatcher):
+    """
+    Collects vector searches from concurrent requests and runs them as a
+    single FAISS index.search call over an (N, d) query matrix.
+    """
+
+    def search(self, index, vector, k: int) -> list:
+        """Return [(row, score), ...] for one query vector, batched with its neighbours"""
+        return self._submit(index, vector, k)
+
+    def _run(self, items):
+        index = items[0][0]
+        max_k = max(k for _, _, k, _ in items)
+        matrix = np.asarray([vector for _, vector, _, _ in items], dtype=np.float32)
+
+        scores, indices = index.search(matrix, max_k)
+
+        for row, (_, _, k, future) in enumerate(items):
+            future.set_result([
+                (int(i), float(score))
+                for score, i in zip(scores[row][:k], indices[row][:k])
+                if i != -1
+            ])
+
+
+class EmbeddingBatcher(_MicroBatcher):
+    """
+    Collects query texts from concurrent requests and encodes them with a
+    single embed_documents call, so the encoder runs one padded batch.
+    """
+
+    def embed(self, embeddings, text: str) -> list:
+        """Return the embedding of one text, batched with its neighbours"""
+        return self._submit(embeddings, text)
+
+    def _run(self, items):
+        embeddings = items[0][0]
+        vectors = embeddings.embed_documents([text for _, text, _ in items])
+
+        for vector, (_, _, future) in zip(vectors, items):
+            future.set_result(vector)
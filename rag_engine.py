@@ -1,17 +1,49 @@
+import cpu_threads  # Thread limits must be in the environment before numpy/faiss/torch load
 import os
+import asyncio
 import threading
-import traceback
+import time
 import logging
 import re
+import hashlib
+from difflib import SequenceMatcher
+import faiss
+from functools import lru_cache
+from sqlalchemy.orm import aliased
+from concurrent.futures import Future, ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
 from supabase_manager import SupabaseStorageManager
-from langchain_huggingface import HuggingFaceEmbeddings
+from query_batcher import QueryBatcher, EmbeddingBatcher
+from semantic_cache import SemanticCache
+from mmap_docstore import load_docstore
+from vector_index import (
+    tune_for_search, distance_strategy_for, to_similarity,
+    load_or_build_hnsw, hnsw_cache_file, prefault, read_index_mmap
+)
 from langchain_community.vectorstores import FAISS
 from google import genai
 from dotenv import load_dotenv
 from models import Chat
+from embeddings import get_embeddings, available_cpus
 
 load_dotenv()
 
+__all__ = [
+    "initialize_gemini",
+    "warm_up_gemini",
+    "GREETING_RESPONSE",
+    "load_vectorstore",
+    "start_loading_vectorstore",
+    "wait_for_vectorstore",
+    "ensure_vectorstore_loaded",
+    "search_docs",
+    "stream_answer",
+    "get_answer",
+    "aget_answer",
+    "get_recent_messages",
+    "rewrite_question",
+]
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,11 +52,116 @@ logger = logging.getLogger(__name__)
 BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME", "vectorstore-bucket")
 REMOTE_FOLDER = "vectorstore"
 LOCAL_PATH = "/tmp/vectorstore"
+GEMINI_MODEL = "gemini-2.0-flash"
+# (remote path, local path) for each vector store file, built once
+VECTORSTORE_FILES = tuple(
+    (f"{REMOTE_FOLDER}/{filename}", os.path.join(LOCAL_PATH, filename))
+    for filename in ("index.faiss", "index.pkl")
+)
+DOCSTORE_CACHE_PATH = os.getenv("DOCSTORE_CACHE_PATH", os.path.join(LOCAL_PATH, "docstore_mmap"))
+RELOAD_COOLDOWN = 60  # Seconds between retries after a failed load
+# Hits below this cosine similarity are noise and are kept out of the prompt
+RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))
+INFLIGHT_TIMEOUT = 30  # Seconds a duplicate request waits on the in-flight one
+REWRITE_SIMILARITY = 0.8  # Rewrites closer than this to the question reuse its search
+REWRITE_ANSWER_CHARS = 600  # Per past answer in the rewrite prompt; the opening names the topic
+WARMUP_QUERIES = ("contact phone email", "what services do you offer", "careers and jobs")
+
+# Batched searches are split across OpenMP threads inside FAISS
+FAISS_NUM_THREADS = int(os.getenv("FAISS_NUM_THREADS", available_cpus()))
+faiss.omp_set_num_threads(FAISS_NUM_THREADS)
+
+# Prompt template pieces, built once at import
+_CONTEXT_SEP = "\n\n---\n\n"
+
+_PROMPT_INTRO = """You are a helpful assistant for Primis Digital, a technology company.
+
+Using the information from Primis Digital's website given below, answer the user's question accurately and professionally."""
+
+_PROMPT_CONTEXT = "\n\nCONTEXT FROM PRIMIS DIGITAL:\n"
+_PROMPT_QUESTION = "\n\nUSER QUESTION: "
+_PROMPT_ANSWER = "\n\nANSWER:"
+
+_GENERAL_INSTRUCTIONS = """
+
+GENERAL INSTRUCTIONS:
+- Answer based ONLY on the provided context
+- Be specific and cite relevant details
+- If the context doesn't contain enough information to fully answer, end your response with: "Please contact our team for further information."
+- Keep your answer professional and well-formatted
+- Use clear paragraphs and formatting
+"""
+
+_LIST_INSTRUCTIONS = """
+- **CRITICAL**: The user is asking for a LIST. You MUST provide a COMPLETE and COMPREHENSIVE list of ALL items found in the context
+- Do NOT summarize or give examples - LIST EVERY SINGLE ITEM mentioned in the context
+- Use bullet points or numbered lists for clarity
+- Include brief descriptions for each item
+- If services/products are mentioned, list ALL of them with their details
+- Do not say "such as" or "including" - be exhaustive and complete"""
+
+_DEFAULT_INSTRUCTIONS = """
+- Provide detailed and specific information
+- If multiple items are mentioned, cover all of them
+- Be thorough and complete in your response"""
+
+_LINK_INSTRUCTIONS = """
+
+LINK HANDLING INSTRUCTIONS:
+- **CRITICAL**: If there are any URLs/links in the context that are relevant to the question, you MUST include them in your answer
+- For job-related queries: Include ALL career page links and mention how to apply
+- For blog-related queries: Include ALL direct links to blog posts or articles  
+- For service-related queries: Include ALL service page links with descriptions
+- Format links clearly: either as clickable text or on separate lines
+- If multiple relevant links exist, include ALL of them - do not omit any"""
+
+# Static instructions lead the prompt so every request shares an identical
+# prefix that Gemini can reuse; only context and question follow it
+_PROMPT_HEAD_LIST = _PROMPT_INTRO + _GENERAL_INSTRUCTIONS + _LIST_INSTRUCTIONS + _LINK_INSTRUCTIONS + _PROMPT_CONTEXT
+_PROMPT_HEAD_DEFAULT = _PROMPT_INTRO + _GENERAL_INSTRUCTIONS + _DEFAULT_INSTRUCTIONS + _LINK_INSTRUCTIONS + _PROMPT_CONTEXT
+
+_GREETINGS = frozenset({
+    'hello', 'hi', 'hey', 'good morning', 'good afternoon',
+    'good evening', 'greetings', 'howdy', 'hola', 'namaste',
+    'hi there', 'hello there'
+})
+_MAX_GREETING_LEN = max(len(greeting) for greeting in _GREETINGS)
+_URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+GREETING_RESPONSE = (
+    "Hello! 👋 I'm the Primis Digital support assistant. "
+    "I can help you with information about our services, careers, blog posts, and more. "
+    "How can I assist you today?"
+)
+
+# Words that point back into the conversation; without them a question
+# of a few words stands on its own and skips the rewrite round-trip
+_ANAPHORA = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|his|her|above|earlier|previous)\b",
+    re.IGNORECASE
+)
+
+# Concurrent searches within this window are sent to FAISS as one batch
+_batcher = QueryBatcher(max_batch=16, max_wait_ms=20)
+# Query encodes are batched the same way; a shorter window since a lone query waits it out
+_encoder = EmbeddingBatcher(max_batch=16, max_wait_ms=5)
+# Speculative searches that run while Gemini rewrites a follow-up
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-search")
 
 # Global variables
 db = None
-is_loading = True
 gemini_client = None
+_loaded_event = threading.Event()
+_failed_event = threading.Event()
+_load_lock = threading.Lock()
+_load_thread = None
+_last_load_attempt = 0.0
+_answer_cache = LRUCache(maxsize=256)
+_question_cache = TTLCache(maxsize=512, ttl=3600)  # Normalized question -> answer
+_semantic_cache = SemanticCache(maxsize=256, threshold=0.95, ttl=3600)  # Rephrasings of cached questions
+_answer_cache_lock = threading.Lock()
+_inflight = {}  # Prompt digest -> Future for the Gemini call answering it
+_inflight_lock = threading.Lock()
 
 
 def initialize_gemini():
@@ -39,87 +176,205 @@ def initialize_gemini():
         logger.info("✅ Gemini client initialized")
         return True
     except Exception as e:
-        logger.error(f"❌ Failed to initialize Gemini: {str(e)}")
+        logger.error("❌ Failed to initialize Gemini: %s", e)
         return False
 
 
+async def warm_up_gemini():
+    """
+    Open the Gemini HTTPS connections before the first question.
+    A model metadata lookup costs no tokens; the sync client (streaming) and
+    the async client (chat and voice) keep separate connection pools, and the
+    async one must be warmed on the serving event loop.
+    """
+    if gemini_client is None:
+        return
+    try:
+        await asyncio.gather(
+            asyncio.to_thread(gemini_client.models.get, model=GEMINI_MODEL),
+            gemini_client.aio.models.get(model=GEMINI_MODEL),
+        )
+        logger.info("🔥 Gemini connections warmed")
+    except Exception as e:
+        logger.warning("⚠️ Gemini warm-up failed: %s", e)
+
+
+def load_faiss_mmap(path, embeddings):
+    """Load a saved LangChain FAISS store with the index and docstore memory-mapped"""
+    index_file = os.path.join(path, "index.faiss")
+    index = read_index_mmap(index_file)
+
+    # Stores uploaded before the HNSW switch are brute-force flat indexes
+    if isinstance(index, faiss.IndexFlat):
+        index = load_or_build_hnsw(index_file, index)
+
+    docstore, index_to_docstore_id = load_docstore(os.path.join(path, "index.pkl"), DOCSTORE_CACHE_PATH)
+
+    tune_for_search(index)
+    store = FAISS(
+        embeddings,
+        index,
+        docstore,
+        index_to_docstore_id,
+        distance_strategy=distance_strategy_for(index)
+    )
+    return store
+
+
+def warm_up(store):
+    """
+    Pay one-time costs (page faults on the mapped index, encoder kernel
+    selection, batcher thread start) before the first user query
+    """
+    index_file = os.path.join(LOCAL_PATH, "index.faiss")
+    for path in (index_file, hnsw_cache_file(index_file)):
+        prefault(path)
+
+    for query in WARMUP_QUERIES:
+        search_docs(store, query, 6)
+    logger.info("🔥 Warm-up complete")
+
+
+def discard_spent_downloads():
+    """
+    /tmp is memory-backed on Cloud Run: remove downloaded files the loaded
+    store no longer reads. The docstore lives in memory or the mmap cache;
+    index.faiss is only kept when it is the file being served.
+    """
+    index_file = os.path.join(LOCAL_PATH, "index.faiss")
+    spent = [os.path.join(LOCAL_PATH, "index.pkl")]
+    if os.path.exists(hnsw_cache_file(index_file)):
+        spent.append(index_file)  # Served from the converted HNSW copy
+
+    for path in spent:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
 def load_vectorstore():
     """Load vector store from Supabase"""
-    global db, is_loading
+    global db
 
     try:
         logger.info("📥 Starting vector store download...")
 
-        os.makedirs(LOCAL_PATH, exist_ok=True)
-        storage = SupabaseStorageManager()
-
-        files_to_download = ["index.faiss", "index.pkl"]
-
-        for filename in files_to_download:
-            remote_path = f"{REMOTE_FOLDER}/{filename}"
-            local_file = os.path.join(LOCAL_PATH, filename)
-
-            logger.info(f"⬇️  Downloading {remote_path}...")
-            success = storage.download_file(remote_path, local_file, BUCKET_NAME)
+        # Load the embedding model while the index downloads
+        executor = ThreadPoolExecutor(max_workers=1)
+        embeddings_future = executor.submit(get_embeddings)
+        executor.shutdown(wait=False)
 
-            if not success:
-                raise Exception(f"Failed to download {remote_path}")
+        os.makedirs(LOCAL_PATH, exist_ok=True)
+        storage = SupabaseStorageManager.get()
 
-            if os.path.exists(local_file):
-                size = os.path.getsize(local_file)
-                logger.info(f"✅ Downloaded {filename}: {size:,} bytes")
-            else:
-                raise Exception(f"File not found after download: {filename}")
+        # True only when every file arrived; each is moved into place only
+        # once complete, and the manager logs its size
+        if not storage.download_files(VECTORSTORE_FILES, BUCKET_NAME):
+            raise Exception("Failed to download vector store files")
 
-        logger.info("🔧 Initializing embeddings...")
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            cache_folder="/app/model_cache"
-        )
+        logger.info("🔧 Waiting for embeddings model...")
+        embeddings = embeddings_future.result()
 
-        logger.info("📚 Loading FAISS index...")
-        db = FAISS.load_local(
-            LOCAL_PATH,
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
+        logger.info("📚 Loading FAISS index (mmap)...")
+        store = load_faiss_mmap(LOCAL_PATH, embeddings)
 
-        test_results = db.similarity_search("test query", k=1)
-        logger.info(f"✅ Vector store loaded! Test search returned {len(test_results)} results")
+        test_results = store.similarity_search("test query", k=1)
+        logger.info("✅ Vector store loaded! Test search returned %d results", len(test_results))
 
         if test_results:
-            logger.info(f"📄 Sample content: {test_results[0].page_content[:200]}...")
+            logger.info("📄 Sample content: %.200s...", test_results[0].page_content)
 
-        is_loading = False
+        warm_up(store)
+        discard_spent_downloads()
+
+        db = store
+        _failed_event.clear()
+        _loaded_event.set()
         logger.info("🎉 Vector store ready!")
 
     except Exception as e:
-        logger.error(f"❌ Vector store loading failed: {str(e)}")
-        logger.error(traceback.format_exc())
-        is_loading = False
+        logger.exception("❌ Vector store loading failed: %s", e)
+        _failed_event.set()
 
 
 def start_loading_vectorstore():
-    """Start loading vector store in background thread"""
-    thread = threading.Thread(target=load_vectorstore, daemon=True)
-    thread.start()
+    """Start loading vector store in background thread (no-op if already started)"""
+    global _load_thread, _last_load_attempt
+    with _load_lock:
+        if _load_thread is not None:
+            return _load_thread
+        _last_load_attempt = time.monotonic()
+        _load_thread = threading.Thread(target=load_vectorstore, daemon=True)
+        _load_thread.start()
     logger.info("🔄 Vector store loading in background...")
+    return _load_thread
+
+
+def wait_for_vectorstore(timeout=None):
+    """Block until the current load attempt finishes; True if the store is ready"""
+    thread = _load_thread
+    if thread is not None:
+        thread.join(timeout)
+    return _loaded_event.is_set()
+
+
+def ensure_vectorstore_loaded():
+    """Restart a failed vector store load, at most once per RELOAD_COOLDOWN"""
+    global _load_thread
+    if _loaded_event.is_set() or not _failed_event.is_set():
+        return
+
+    with _load_lock:
+        if _load_thread is not None and _load_thread.is_alive():
+            return
+        if time.monotonic() - _last_load_attempt < RELOAD_COOLDOWN:
+            return
+        _failed_event.clear()
+        _load_thread = None
+
+    logger.info("🔁 Retrying vector store load...")
+    start_loading_vectorstore()
+
+
+def _normalize_query(query):
+    """
+    Cache key for a query: case, spacing and trailing punctuation don't change the intent.
+    Shared by the embedding, question and semantic caches so they all hit together.
+    """
+    return " ".join(query.casefold().split()).rstrip("?!. ")
+
+
+@lru_cache(maxsize=1024)
+def _embed_query(query):
+    """Embed a normalized search query; repeated queries skip the encoder entirely"""
+    return tuple(_encoder.embed(get_embeddings(), query))
+
+
+def search_docs(db, query, k):
+    """
+    Similarity search using the cached query embedding, batched with concurrent requests.
+    Drops hits below RAG_MIN_SIMILARITY; only the k returned rows are
+    looked up (and, with the mmap docstore, decoded).
+    """
+    ids = db.index_to_docstore_id
+    return [
+        db.docstore.search(ids[row]) for row, score in _batcher.search(db.index, _embed_query(_normalize_query(query)), k)
+        if to_similarity(db.index, score) >= RAG_MIN_SIMILARITY
+    ]
 
 
 def is_greeting(question):
     """Check if the question is a greeting"""
-    greetings = [
-        'hello', 'hi', 'hey', 'good morning', 'good afternoon', 
-        'good evening', 'greetings', 'howdy', 'hola', 'namaste',
-        'hi there', 'hello there'
-    ]
-    question_lower = question.lower().strip()
-    
-    # Check for exact matches or greeting at the start of the message
-    for greeting in greetings:
-        if question_lower == greeting or question_lower.startswith(greeting + ' ') or question_lower.startswith(greeting + ','):
+    question_lower = question.strip().casefold()
+    if question_lower in _GREETINGS:
+        return True
+
+    # Greeting at the start of the message, followed by a space or comma
+    for i, char in enumerate(question_lower[:_MAX_GREETING_LEN + 1]):
+        if char in " ," and question_lower[:i] in _GREETINGS:
             return True
-    
+
     return False
 
 
@@ -138,11 +393,8 @@ def is_network_error(error):
 def extract_links(docs):
     """Extract URLs from documents"""
     links = []
-    url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    
     for doc in docs:
-        found_urls = re.findall(url_pattern, doc.page_content)
-        links.extend(found_urls)
+        links.extend(_URL_RE.findall(doc.page_content))
     
     return list(set(links))  # Remove duplicates
 
@@ -165,6 +417,11 @@ def detect_query_type(question):
     return detected_types
 
 
+def is_self_contained(question):
+    """Check if a follow-up question can be searched without the chat history"""
+    return len(question.split()) >= 4 and not _ANAPHORA.search(question)
+
+
 def is_list_query(question):
     """Detect if user is asking for a complete list"""
     list_indicators = [
@@ -185,7 +442,7 @@ def get_comprehensive_docs(db, query, k=10):
     seen_content = set()
     
     # Primary search
-    primary_docs = db.similarity_search(query, k=k)
+    primary_docs = search_docs(db, query, k)
     
     for doc in primary_docs:
         content_hash = hash(doc.page_content[:200])  # Use first 200 chars as identifier
@@ -219,192 +476,370 @@ def get_comprehensive_docs(db, query, k=10):
     
     # Perform additional searches
     for additional_query in additional_searches:
-        additional_docs = db.similarity_search(additional_query, k=5)
+        additional_docs = search_docs(db, additional_query, 5)
         for doc in additional_docs:
             content_hash = hash(doc.page_content[:200])
             if content_hash not in seen_content:
                 all_docs.append(doc)
                 seen_content.add(content_hash)
     
-    logger.info(f"📚 Comprehensive search returned {len(all_docs)} unique documents")
+    logger.info("📚 Comprehensive search returned %d unique documents", len(all_docs))
     return all_docs
 
 
-def get_answer(question, session_id=None, db_session=None):
+def retrieve_docs(query, is_asking_for_list):
+    """Search for relevant documents - use comprehensive search for lists"""
+    if is_asking_for_list:
+        docs = get_comprehensive_docs(db, query, k=15)
+        logger.info("📚 Using comprehensive search - Retrieved %d documents", len(docs))
+    else:
+        docs = search_docs(db, query, 6)
+        logger.info("📚 Using standard search - Retrieved %d documents", len(docs))
+    return docs
+
+
+def _merge_docs(primary, secondary, limit):
+    """primary first, then unseen docs from secondary, up to limit"""
+    seen = {doc.page_content for doc in primary}
+    merged = list(primary)
+    for doc in secondary:
+        if len(merged) >= limit:
+            break
+        if doc.page_content not in seen:
+            merged.append(doc)
+            seen.add(doc.page_content)
+    return merged
+
+
+def _retrieve_with_rewrite(chat_history, question, is_asking_for_list):
     """
-    Get answer using RAG with conversational context.
-    Enhanced version with greeting detection, link extraction, and comprehensive responses.
+    Search the raw question while Gemini rewrites it; search again only
+    when the rewrite differs meaningfully, ranking its hits first
     """
-    global db, gemini_client
+    speculative = _search_pool.submit(retrieve_docs, question, is_asking_for_list)
+
+    search_query = rewrite_question(chat_history, question)
+    logger.info("🔄 Rewritten query: %s", search_query)
+    docs = speculative.result()
+
+    similarity = SequenceMatcher(None, search_query.lower(), question.lower()).ratio()
+    if similarity >= REWRITE_SIMILARITY:
+        return docs
+
+    rewritten_docs = retrieve_docs(search_query, is_asking_for_list)
+    return _merge_docs(rewritten_docs, docs, max(len(rewritten_docs), 15 if is_asking_for_list else 6))
+
+
+def _prepare_answer(question, session_id=None, db_session=None):
+    """
+    Run retrieval and build the Gemini prompt.
+    Returns (prompt, None), or (None, reply) when a canned reply answers directly.
+    """
+    # Check if greeting
+    if is_greeting(question):
+        return None, GREETING_RESPONSE
     
-    try:
-        # Check if greeting
-        if is_greeting(question):
-            return (
-                "Hello! 👋 I'm the Primis Digital support assistant. "
-                "I can help you with information about our services, careers, blog posts, and more. "
-                "How can I assist you today?"
-            )
-        
-        # Check if vector store is ready
-        if is_loading:
-            return "The knowledge base is still loading. Please try again in a moment."
-        
-        if db is None:
-            return (
-                "I'm having trouble accessing the knowledge base right now. "
-                "Please try again in a moment or contact our team directly."
-            )
-        
-        if gemini_client is None:
-            return "AI service is not available. Please contact support."
-        
-        # Get chat history for context if session provided
-        search_query = question
-        if session_id and db_session:
-            try:
-                chat_history = get_recent_messages(db_session, session_id, limit=5)
-                if chat_history:
-                    logger.info(f"🔄 Found {len(chat_history)} previous messages")
-                    search_query = rewrite_question(chat_history, question)
-                    logger.info(f"🔄 Rewritten query: {search_query}")
-            except Exception as e:
-                logger.error(f"⚠️ Error getting chat history: {str(e)}")
-                # Continue with original question
-        
-        # Detect if this is a list query - if so, retrieve more documents
-        is_asking_for_list = is_list_query(question)
-        
-        logger.info(f"📊 Query analysis - List query: {is_asking_for_list}")
-
-        # Search for relevant documents - use comprehensive search for lists
-        if is_asking_for_list:
-            docs = get_comprehensive_docs(db, search_query, k=15)
-            logger.info(f"📚 Using comprehensive search - Retrieved {len(docs)} documents")
-        else:
-            docs = db.similarity_search(search_query, k=6)
-            logger.info(f"📚 Using standard search - Retrieved {len(docs)} documents")
-
-        if not docs:
-            logger.warning("⚠️ No relevant documents found")
-            return (
-                "I couldn't find specific information about that in our knowledge base. "
-                "Please contact our team for further information. You can reach us through "
-                "our website's contact form or email us directly."
-            )
+    # Check if vector store is ready; is_set() is a plain flag read, so once
+    # loaded this skips the condition lock Event.wait() takes on every call
+    if not _loaded_event.is_set() and not _loaded_event.wait(timeout=0.1):
+        if not _failed_event.is_set():
+            return None, "The knowledge base is still loading. Please try again in a moment."
+        ensure_vectorstore_loaded()
+        return None, (
+            "I'm having trouble accessing the knowledge base right now. "
+            "Please try again in a moment or contact our team directly."
+        )
+    
+    if gemini_client is None:
+        return None, "AI service is not available. Please contact support."
+    
+    # Detect if this is a list query - if so, retrieve more documents
+    is_asking_for_list = is_list_query(question)
+    
+    logger.info("📊 Query analysis - List query: %s", is_asking_for_list)
+
+    # Get chat history for context if session provided
+    chat_history = []
+    if session_id and db_session:
+        try:
+            chat_history = get_recent_messages(db_session, session_id, limit=5)
+        except Exception as e:
+            logger.error("⚠️ Error getting chat history: %s", e)
+            # Continue with original question
+
+    if chat_history and not is_self_contained(question):
+        logger.info("🔄 Found %d previous messages", len(chat_history))
+        docs = _retrieve_with_rewrite(chat_history, question, is_asking_for_list)
+    else:
+        docs = retrieve_docs(question, is_asking_for_list)
+
+    if not docs:
+        logger.warning("⚠️ No relevant documents found")
+        return None, (
+            "I couldn't find specific information about that in our knowledge base. "
+            "Please contact our team for further information. You can reach us through "
+            "our website's contact form or email us directly."
+        )
 
+    # Diagnostics only; skip the regex scans entirely when INFO is off
+    if logger.isEnabledFor(logging.INFO):
         # Log document details
-        for i, doc in enumerate(docs):
-            logger.info(f"  Doc {i+1}: {doc.page_content[:100]}...")
+        for i, doc in enumerate(docs, 1):
+            logger.info("  Doc %d: %.100s...", i, doc.page_content)
 
         # Extract links from documents
         links = extract_links(docs)
         if links:
-            logger.info(f"🔗 Found {len(links)} links in documents: {links}")
+            logger.info("🔗 Found %d links in documents: %s", len(links), links)
 
         # Detect query type
         query_types = detect_query_type(question)
         if query_types:
-            logger.info(f"🔍 Query types detected: {query_types}")
+            logger.info("🔍 Query types detected: %s", query_types)
 
-        context = "\n\n---\n\n".join([doc.page_content for doc in docs])
+    # Only the context and question vary; the instruction text is prebuilt.
+    # Documents go straight into the one join so the context is copied once
+    parts = [_PROMPT_HEAD_LIST if is_asking_for_list else _PROMPT_HEAD_DEFAULT, docs[0].page_content]
+    for doc in docs[1:]:
+        parts.append(_CONTEXT_SEP)
+        parts.append(doc.page_content)
+    parts += (_PROMPT_QUESTION, question, _PROMPT_ANSWER)
+    prompt = "".join(parts)
 
-        # Build enhanced prompt based on query type
-        if is_asking_for_list:
-            specific_instructions = """
-- **CRITICAL**: The user is asking for a LIST. You MUST provide a COMPLETE and COMPREHENSIVE list of ALL items found in the context
-- Do NOT summarize or give examples - LIST EVERY SINGLE ITEM mentioned in the context
-- Use bullet points or numbered lists for clarity
-- Include brief descriptions for each item
-- If services/products are mentioned, list ALL of them with their details
-- Do not say "such as" or "including" - be exhaustive and complete"""
-        else:
-            specific_instructions = """
-- Provide detailed and specific information
-- If multiple items are mentioned, cover all of them
-- Be thorough and complete in your response"""
+    return prompt, None
 
-        # Build enhanced prompt with link instructions
-        prompt = f"""You are a helpful assistant for Primis Digital, a technology company.
 
-Based on the following information from Primis Digital's website, answer the user's question accurately and professionally.
+def _error_reply(error):
+    """User-facing message for a failed answer"""
+    error_message = str(error)
+    logger.error("❌ Error in get_answer: %s", error_message, exc_info=error)
 
-CONTEXT FROM PRIMIS DIGITAL:
-{context}
+    # Check if it's a network error
+    if is_network_error(error_message):
+        return (
+            "We're experiencing network connectivity issues at the moment. "
+            "Please try again in a few moments. If the problem persists, "
+            "please contact our support team."
+        )
 
-USER QUESTION: {question}
+    # Generic error response
+    return (
+        "I apologize, but I encountered an issue while processing your request. "
+        "Please contact our team for further assistance."
+    )
 
-GENERAL INSTRUCTIONS:
-- Answer based ONLY on the provided context
-- Be specific and cite relevant details
-- If the context doesn't contain enough information to fully answer, end your response with: "Please contact our team for further information."
-- Keep your answer professional and well-formatted
-- Use clear paragraphs and formatting
-{specific_instructions}
 
-LINK HANDLING INSTRUCTIONS:
-- **CRITICAL**: If there are any URLs/links in the context that are relevant to the question, you MUST include them in your answer
-- For job-related queries: Include ALL career page links and mention how to apply
-- For blog-related queries: Include ALL direct links to blog posts or articles  
-- For service-related queries: Include ALL service page links with descriptions
-- Format links clearly: either as clickable text or on separate lines
-- If multiple relevant links exist, include ALL of them - do not omit any
+def _question_key(question, session_id, db_session):
+    """
+    Question-cache key, or None when chat history may shape the answer
+    (only follow-ups that aren't self-contained get rewritten from history)
+    """
+    if session_id and db_session and not is_self_contained(question):
+        return None
+    return _normalize_query(question)
+
+
+def _cached_question(question_key):
+    """Previous answer to the same question, skipping retrieval and Gemini"""
+    if question_key is None:
+        return None
+    with _answer_cache_lock:
+        cached = _question_cache.get(question_key)
+    if cached is not None:
+        logger.info("⚡ Answer served from question cache")
+    return cached
+
+
+def _similar_answer(question_key):
+    """Answer to a near-identical earlier question, matched on its embedding"""
+    # Greetings get a canned reply, and before load the encoder may not exist yet
+    if question_key is None or not _loaded_event.is_set() or is_greeting(question_key):
+        return None
+    cached = _semantic_cache.get(_embed_query(question_key))
+    if cached is not None:
+        logger.info("⚡ Answer served from semantic cache")
+    return cached
+
+
+def _cached_answer(prompt):
+    """Previous answer for an identical prompt (same question and context), if any"""
+    with _answer_cache_lock:
+        cached = _answer_cache.get(prompt)
+    if cached is not None:
+        logger.info("⚡ Answer served from cache")
+    return cached
+
+
+def _claim_inflight(prompt):
+    """
+    Identical prompts arriving together share one Gemini call.
+    Returns (key, future, is_leader); followers wait on the leader's future.
+    """
+    key = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            logger.info("⏳ Waiting on identical in-flight request")
+            return key, future, False
+        future = _inflight[key] = Future()
+        return key, future, True
+
+
+def _finish_inflight(future, prompt, answer, question_key=None):
+    """Cache the leader's answer and hand it to the waiters"""
+    with _answer_cache_lock:
+        _answer_cache[prompt] = answer
+        if question_key is not None:
+            _question_cache[question_key] = answer
+    if question_key is not None:
+        _semantic_cache.put(question_key, _embed_query(question_key), answer)
+    future.set_result(answer)
+    logger.info("✅ Answer generated: %d characters", len(answer))
+
+
+def _release_inflight(key, future, error=None):
+    """Drop the in-flight entry; waiters get the error if no answer was set"""
+    if not future.done():
+        # Generation failed, or the stream was closed early (client went away)
+        future.set_exception(error or RuntimeError("In-flight request was abandoned"))
+    with _inflight_lock:
+        _inflight.pop(key, None)
+
+
+def stream_answer(question, session_id=None, db_session=None):
+    """
+    Stream the answer as Gemini generates it.
+    Canned replies and cached answers are yielded as a single chunk.
+    """
+    streamed = False
+    try:
+        question_key = _question_key(question, session_id, db_session)
+        cached = _cached_question(question_key) or _similar_answer(question_key)
+        if cached is not None:
+            yield cached
+            return
+
+        prompt, reply = _prepare_answer(question, session_id, db_session)
+        if reply is not None:
+            yield reply
+            return
+
+        cached = _cached_answer(prompt)
+        if cached is not None:
+            yield cached
+            return
+
+        key, future, is_leader = _claim_inflight(prompt)
+        if not is_leader:
+            yield future.result(timeout=INFLIGHT_TIMEOUT)
+            return
+
+        error = None
+        try:
+            logger.info("🤖 Generating answer with Gemini...")
+            parts = []
+            for chunk in gemini_client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt
+            ):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    streamed = True
+                    yield chunk.text
+
+            _finish_inflight(future, prompt, "".join(parts).strip(), question_key)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _release_inflight(key, future, error)
 
-ANSWER:"""
+    except Exception as e:
+        reply = _error_reply(e)
+        yield "\n\n" + reply if streamed else reply
 
-        logger.info("🤖 Generating answer with Gemini...")
-        response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
 
-        answer = response.text.strip()
-        logger.info(f"✅ Answer generated: {len(answer)} characters")
+def get_answer(question, session_id=None, db_session=None):
+    """
+    Get answer using RAG with conversational context.
+    Enhanced version with greeting detection, link extraction, and comprehensive responses.
+    """
+    return "".join(stream_answer(question, session_id, db_session)).strip()
 
-        return answer
 
-    except Exception as e:
-        error_message = str(e)
-        logger.error(f"❌ Error in get_answer: {error_message}")
-        logger.error(traceback.format_exc())
-        
-        # Check if it's a network error
-        if is_network_error(error_message):
-            return (
-                "We're experiencing network connectivity issues at the moment. "
-                "Please try again in a few moments. If the problem persists, "
-                "please contact our support team."
+async def aget_answer(question, session_id=None, db_session=None):
+    """
+    Async get_answer for the FastAPI routes.
+    Retrieval runs in a worker thread and Gemini is awaited on the async client,
+    so the event loop keeps serving other requests during the LLM round-trip.
+    """
+    try:
+        question_key = _question_key(question, session_id, db_session)
+        cached = _cached_question(question_key) or await asyncio.to_thread(_similar_answer, question_key)
+        if cached is not None:
+            return cached
+
+        prompt, reply = await asyncio.to_thread(_prepare_answer, question, session_id, db_session)
+        if reply is not None:
+            return reply
+
+        cached = _cached_answer(prompt)
+        if cached is not None:
+            return cached
+
+        key, future, is_leader = _claim_inflight(prompt)
+        if not is_leader:
+            # shield: timing out must not cancel the leader's future
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                INFLIGHT_TIMEOUT
             )
-        
-        # Generic error response
-        return (
-            "I apologize, but I encountered an issue while processing your request. "
-            "Please contact our team for further assistance."
-        )
+
+        error = None
+        try:
+            logger.info("🤖 Generating answer with Gemini...")
+            response = await gemini_client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt
+            )
+            answer = response.text.strip()
+            _finish_inflight(future, prompt, answer, question_key)
+            return answer
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _release_inflight(key, future, error)
+
+    except Exception as e:
+        return _error_reply(e)
 
 
 def get_recent_messages(db, session_id, limit=5):
     """Fetch recent chat messages for context"""
     try:
-        chats = (
+        # Newest N via the (session_id, created_at) index, returned oldest first
+        latest = (
             db.query(Chat)
             .filter(Chat.session_id == session_id)
             .order_by(Chat.created_at.desc())
             .limit(limit)
-            .all()
+            .subquery()
         )
-        return list(reversed(chats))
+        recent = aliased(Chat, latest)
+        return db.query(recent).order_by(recent.created_at.asc()).all()
     except Exception as e:
-        logger.error(f"❌ Error fetching recent messages: {str(e)}")
+        logger.error("❌ Error fetching recent messages: %s", e)
         return []
 
 
 def rewrite_question(chat_history, user_question):
     """Convert follow-up questions into standalone questions"""
     try:
-        conversation = ""
-        for chat in chat_history:
-            conversation += f"User: {chat.question}\nAssistant: {chat.answer}\n"
+        conversation = "".join(
+            f"User: {chat.question}\nAssistant: {chat.answer[:REWRITE_ANSWER_CHARS]}\n"
+            for chat in chat_history
+        )
 
         prompt = f"""You are a query rewriter.
 
@@ -420,7 +855,7 @@ Rewritten standalone question:"""
 
         logger.info("🤖 Generating answer with Gemini...")
         response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
+            model=GEMINI_MODEL,
             contents=prompt
         )
 
@@ -428,6 +863,11 @@ Rewritten standalone question:"""
         return rewritten if rewritten else user_question
         
     except Exception as e:
-        logger.error(f"❌ Error rewriting question: {str(e)}")
+        logger.error("❌ Error rewriting question: %s", e)
         return user_question  # Return original question if rewriting fails
 
+
+# Start the download at import so it overlaps app startup and Gemini init;
+# the startup hook's start_loading_vectorstore() call then becomes a no-op
+if os.getenv("RAG_PREFETCH_ON_IMPORT") == "1":
+    start_loading_vectorstore()
@@ -1,14 +1,17 @@
-import requests
+import cpu_threads  # Thread limits must be in the environment before numpy/faiss/torch load
+import asyncio
+import aiohttp
 from bs4 import BeautifulSoup
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlsplit, urlunsplit
 import time
 import os
-import json
 import logging
+import orjson
 from supabase_manager import SupabaseStorageManager
+from embeddings import get_embeddings, embed_corpus
+from vector_index import to_hnsw, DISTANCE_STRATEGY
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,163 +19,249 @@ logger = logging.getLogger(__name__)
 # Configuration
 BASE_URL = "https://primisdigital.com/"
 MAX_PAGES = 100
-DELAY = 1
+CONCURRENCY = 8  # Pages fetched at once
+DELAY = 0.5  # Polite delay per worker between requests
+FETCH_ATTEMPTS = 3  # Connection errors and 5xx are retried with backoff
 BUCKET_NAME = "vectorstore-bucket"
+HTTP_CACHE_FILE = "data/http_cache.json"  # url -> validators plus the parsed page
 
-def is_valid_url(url, base_domain):
-    """Check if URL belongs to the same domain"""
-    parsed = urlparse(url)
-    base_parsed = urlparse(base_domain)
-    return parsed.netloc == base_parsed.netloc
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
 
-def fetch_text(url):
-    """Extract text content from a URL using BeautifulSoup"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-        }
-        r = requests.get(url, timeout=15, headers=headers)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        # Remove unwanted tags
-        for tag in soup(["script", "style", "noscript", "header", "footer", "nav"]):
-            tag.decompose()
-
-        # Get text with better formatting
-        text = soup.get_text(separator="\n", strip=True)
-        
-        # Clean up whitespace
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        text = ' '.join(lines)
-        
-        return text
-    except Exception as e:
-        logger.error(f"❌ Error fetching {url}: {e}")
-        return ""
+def is_valid_url(parts, base_netloc):
+    """Check if an already-split URL belongs to the same domain"""
+    return parts.netloc == base_netloc
 
-def get_all_links(url, base_url):
-    """Extract all internal links from a page"""
+def load_http_cache():
+    """Validators and parsed pages from the previous crawl, or {}"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        r = requests.get(url, timeout=10, headers=headers)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        links = set()
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.startswith('#') or href.startswith('javascript:'):
-                continue
-                
-            full_url = urljoin(base_url, href)
-            full_url = full_url.split('#')[0].split('?')[0]
-
-            if is_valid_url(full_url, base_url):
-                links.add(full_url)
-
-        return links
-    except Exception as e:
-        logger.error(f"❌ Error getting links from {url}: {e}")
-        return set()
+        with open(HTTP_CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
 
-def crawl_website(start_url, max_pages=MAX_PAGES):
-    """Crawl entire website starting from start_url"""
-    visited = set()
-    to_visit = {start_url}
-    all_pages = []
+def save_http_cache(http_cache):
+    os.makedirs(os.path.dirname(HTTP_CACHE_FILE), exist_ok=True)
+    with open(HTTP_CACHE_FILE, 'wb') as f:
+        f.write(orjson.dumps(http_cache))
 
-    logger.info(f"🚀 Starting crawl from: {start_url}")
+def parse_page(content, base_url):
+    """Parse fetched HTML into (text, internal links)"""
+    soup = BeautifulSoup(content, "lxml")
 
-    while to_visit and len(visited) < max_pages:
-        url = to_visit.pop()
-        if url in visited:
+    # Collect links before nav/header/footer are stripped from the text
+    base_netloc = urlsplit(base_url).netloc
+    links = set()
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if href.startswith('#') or href.startswith('javascript:'):
             continue
 
-        logger.info(f"🔹 [{len(visited) + 1}/{max_pages}] Crawling: {url}")
+        parts = urlsplit(urljoin(base_url, href))
+        if is_valid_url(parts, base_netloc):
+            links.add(urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')))
+
+    # Remove unwanted tags
+    for tag in soup(["script", "style", "noscript", "header", "footer", "nav"]):
+        tag.decompose()
+
+    # Get text with better formatting
+    text = soup.get_text(separator="\n", strip=True)
+    
+    # Clean up whitespace
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    text = ' '.join(lines)
+
+    return text, links
+
+async def _get(session, url, headers):
+    """GET returning (status, body, response headers); connection errors and 5xx are retried"""
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            async with session.get(url, headers=headers) as r:
+                if r.status < 500 or attempt == FETCH_ATTEMPTS - 1:
+                    r.raise_for_status()
+                    return r.status, await r.read(), r.headers
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == FETCH_ATTEMPTS - 1:
+                raise
+        await asyncio.sleep(0.3 * 2 ** attempt)
+
+async def fetch_page(session, url, base_url, http_cache=None):
+    """
+    Fetch a page once and return (text, internal links).
+    With an http_cache, sends a conditional GET and reuses the cached
+    result when the server answers 304 Not Modified.
+    """
+    cached = http_cache.get(url) if http_cache is not None else None
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        status, content, response_headers = await _get(session, url, headers)
+        if status == 304 and cached:
+            logger.info("   ♻️ Not modified, reusing cached page")
+            return cached["text"], set(cached["links"])
+        # BeautifulSoup is CPU-bound; keep it off the event loop
+        text, links = await asyncio.get_running_loop().run_in_executor(None, parse_page, content, base_url)
+    except Exception as e:
+        logger.error("❌ Error fetching %s: %s", url, e)
+        return "", set()
 
-        text = fetch_text(url)
-        if text and len(text) > 200:  # Only save pages with substantial content
-            page_data = {
-                "url": url,
-                "content": text,
-                "timestamp": time.time()
+    etag, last_modified = response_headers.get("ETag"), response_headers.get("Last-Modified")
+    if http_cache is not None:
+        if etag or last_modified:
+            http_cache[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "text": text,
+                "links": sorted(links)
             }
-            all_pages.append(page_data)
-            logger.info(f"   ✅ Saved: {len(text)} chars")
+        else:
+            http_cache.pop(url, None)
 
-        new_links = get_all_links(url, start_url)
-        to_visit.update(new_links - visited)
-        visited.add(url)
-        time.sleep(DELAY)
+    return text, links
 
-    logger.info(f"✅ Crawl complete: {len(all_pages)} pages saved")
-    return all_pages
+async def _crawl(start_url, max_pages, http_cache):
+    """Breadth-first crawl with CONCURRENCY workers sharing one queue"""
+    queue = asyncio.Queue()
+    order = {start_url: 0}  # Discovery order, so output doesn't depend on fetch timing
+    queue.put_nowait(start_url)
+    claimed = 0  # Pages being fetched or already visited; caps the crawl at max_pages
+    pages = {}  # url -> (text, fetched_at)
+
+    async def worker(session):
+        nonlocal claimed
+        while True:
+            url = await queue.get()
+            try:
+                if claimed >= max_pages:
+                    continue
+                claimed += 1
+                logger.info("🔹 [%d/%d] Crawling: %s", claimed, max_pages, url)
+
+                text, new_links = await fetch_page(session, url, start_url, http_cache)
+                if text and len(text) > 200:  # Only save pages with substantial content
+                    pages[url] = (text, time.time())
+                    logger.info("   ✅ Saved: %d chars", len(text))
+
+                for link in new_links:
+                    if link not in order:
+                        order[link] = len(order)
+                        queue.put_nowait(link)
+
+                await asyncio.sleep(DELAY)  # Polite delay
+            except Exception as e:
+                logger.error("❌ Error on %s: %s", url, e)
+            finally:
+                queue.task_done()
+
+    connector = aiohttp.TCPConnector(limit_per_host=CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=15)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(CONCURRENCY)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    return sorted(pages.items(), key=lambda item: order[item[0]])
+
+def crawl_website(start_url, max_pages=MAX_PAGES):
+    """Crawl entire website starting from start_url"""
+    http_cache = load_http_cache()
+    logger.info("🚀 Starting crawl from: %s", start_url)
+
+    pages = asyncio.run(_crawl(start_url, max_pages, http_cache))
+
+    # Saved pages as parallel columns rather than one dict per page
+    urls = [url for url, _ in pages]
+    contents = [text for _, (text, _) in pages]
+    timestamps = [fetched_at for _, (_, fetched_at) in pages]
+
+    save_http_cache(http_cache)
+    logger.info("✅ Crawl complete: %d pages saved", len(urls))
+    return urls, contents, timestamps
 
 def ingest_website():
     """Main function to crawl website and create vector store"""
     
     # Step 1: Crawl website
-    all_pages = crawl_website(BASE_URL, MAX_PAGES)
+    urls, contents, timestamps = crawl_website(BASE_URL, MAX_PAGES)
 
-    if not all_pages:
+    if not urls:
         logger.error("❌ No content found!")
         return
 
     # Save raw crawled data
     os.makedirs('data', exist_ok=True)
-    with open('data/raw_crawl.json', 'w', encoding='utf-8') as f:
-        json.dump(all_pages, f, ensure_ascii=False, indent=2)
+    with open('data/raw_crawl.json', 'wb') as f:
+        f.write(orjson.dumps(
+            [{"url": u, "content": c, "timestamp": t} for u, c, t in zip(urls, contents, timestamps)],
+            option=orjson.OPT_INDENT_2
+        ))
 
-    # Step 2: Combine and Chunk Text
-    full_text = "\n\n".join([f"--- PAGE: {p['url']} ---\n\n{p['content']}" for p in all_pages])
-    
+    # Step 2: Chunk each page separately so chunks keep their source URL
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
         chunk_overlap=50,
         separators=["\n\n", "\n", ". ", " ", ""]
     )
-    chunks = splitter.split_text(full_text)
-    logger.info(f"📄 Total chunks created: {len(chunks)}")
+    docs = splitter.create_documents(
+        [f"--- PAGE: {u} ---\n\n{c}" for u, c in zip(urls, contents)],
+        metadatas=[{"source": u} for u in urls]
+    )
+    chunks = [doc.page_content for doc in docs]
+    logger.info("📄 Total chunks created: %d", len(chunks))
 
     # Save chunks
-    with open('data/chunks_raw.json', 'w', encoding='utf-8') as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+    with open('data/chunks_raw.json', 'wb') as f:
+        f.write(orjson.dumps(chunks, option=orjson.OPT_INDENT_2))
 
     # Step 3: Create embeddings
-    logger.info("🔧 Creating embeddings (HuggingFace)...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    logger.info("🔧 Creating embeddings...")
+    embeddings = get_embeddings()
 
     # Step 4: Create and Save FAISS vector store locally
     logger.info("💾 Saving FAISS index to local folder 'vectorstore'...")
-    db = FAISS.from_texts(chunks, embeddings)
+    vectors = embed_corpus(chunks)
+    db = FAISS.from_embeddings(
+        list(zip(chunks, vectors)),
+        embeddings,
+        metadatas=[doc.metadata for doc in docs],
+        distance_strategy=DISTANCE_STRATEGY
+    )
+    db.index = to_hnsw(db.index)
     db.save_local("vectorstore")
 
     # Step 5: Upload to Supabase
     logger.info("\n☁️ Connecting to Supabase...")
     try:
-        storage = SupabaseStorageManager()
+        storage = SupabaseStorageManager.get()
         
-        logger.info(f"☁️ Uploading to Supabase bucket: {BUCKET_NAME}...")
+        logger.info("☁️ Uploading to Supabase bucket: %s...", BUCKET_NAME)
         
         # Ensure the bucket exists
-        storage.upload_file("vectorstore/index.faiss", "vectorstore/index.faiss", BUCKET_NAME)
-        storage.upload_file("vectorstore/index.pkl", "vectorstore/index.pkl", BUCKET_NAME)
+        storage.upload_files([
+            ("vectorstore/index.faiss", "vectorstore/index.faiss"),
+            ("vectorstore/index.pkl", "vectorstore/index.pkl")
+        ], BUCKET_NAME)
         
         logger.info("\n✅ Success! Website ingested and Supabase vector store updated.")
         
         # Verify upload
         files = storage.list_files(BUCKET_NAME, "vectorstore")
-        logger.info(f"📁 Files in bucket: {len(files)}")
+        logger.info("📁 Files in bucket: %d", len(files))
         
     except Exception as e:
-        logger.error(f"\n❌ Supabase Upload Failed: {e}")
+        logger.error("\n❌ Supabase Upload Failed: %s", e)
         logger.error("Check if 'vectorstore-bucket' exists in your Supabase Storage dashboard.")
 
 if __name__ == "__main__":
@@ -1,64 +1,69 @@
-import requests
+import asyncio
+import aiohttp
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import time
-import json
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import orjson
 import os
 import re
 
+CONCURRENCY = 8  # Pages fetched at once
+DELAY = 0.5  # Polite delay per worker between requests
+# Non-content files and obvious junk, fused into one pattern
+SKIP_RE = re.compile(
+    r'\.(jpg|jpeg|png|gif|svg|pdf|zip|tar|gz|ico|css|js)$'
+    r'|/wp-(admin|includes|content/plugins|content/themes)'
+    r'|\?share='
+    r'|#comment-'
+    r'|/tag/'
+    r'|/author/'
+    r'|/category/'
+)
+PHONE_RES = [
+    re.compile(r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}'),
+    re.compile(r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}\s*(?:ext|x|extension)?\s*\d*'),
+]
+EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
 class PrimisWebsiteScraper:
     def __init__(self, base_url="https://primisdigital.com/"):
         self.base_url = base_url.rstrip("/")
-        self.domain = urlparse(self.base_url).netloc
+        self.domain = urlsplit(self.base_url).netloc
         self.visited = set()
         self.pages = []
         self.contact_keywords = ['contact', 'about', 'company', 'support', 'help', 'reach', 'call', 'phone', 'email']
 
-    def clean_url(self, url):
-        url = url.split("#")[0].split("?")[0]
-        return url.rstrip("/")
+    def clean_url(self, parts):
+        """Rebuild a split URL without query, fragment or trailing slash"""
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", "")).rstrip("/")
 
-    def is_valid_url(self, url):
-        parsed = urlparse(url)
-        if parsed.netloc != self.domain:
+    def is_valid_url(self, parts):
+        """Check an already-split URL; query and fragment are ignored"""
+        if parts.netloc != self.domain:
             return False
 
-        url_lower = url.lower()
+        path_lower = parts.path.lower()
         
         # ALWAYS include contact and about pages
         for keyword in self.contact_keywords:
-            if keyword in url_lower:
+            if keyword in path_lower:
                 return True
 
         # Skip only non-content files and obvious junk
-        skip_patterns = [
-            r'\.(jpg|jpeg|png|gif|svg|pdf|zip|tar|gz|ico|css|js)$',
-            r'/wp-(admin|includes|content/plugins|content/themes)',
-            r'\?share=',
-            r'#comment-',
-            r'/tag/',
-            r'/author/',
-            r'/category/',
-        ]
-        
-        for pattern in skip_patterns:
-            if re.search(pattern, url_lower):
-                return False
-                
-        return True
-
-    def fetch(self, url):
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Accept-Encoding": "gzip, deflate",
-            "Connection": "keep-alive",
-        }
+        return not SKIP_RE.search(path_lower.rstrip("/"))
+
+    async def fetch(self, session, url):
         try:
-            response = requests.get(url, timeout=15, headers=headers)
-            response.raise_for_status()
-            return response
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read()
         except Exception as e:
             print(f"❌ Fetch error for {url}: {e}")
             return None
@@ -69,10 +74,9 @@ class PrimisWebsiteScraper:
             href = a['href']
             if href.startswith('#') or href.startswith('javascript:'):
                 continue
-            full = urljoin(current_url, href)
-            full = self.clean_url(full)
-            if self.is_valid_url(full):
-                links.add(full)
+            parts = urlsplit(urljoin(current_url, href))
+            if self.is_valid_url(parts):
+                links.add(self.clean_url(parts))
         return links
 
     def extract_text(self, soup):
@@ -94,90 +98,114 @@ class PrimisWebsiteScraper:
         """Extract and highlight contact information"""
         contact_info = []
         
-        # Phone number patterns
-        phone_patterns = [
-            r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}',
-            r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}\s*(?:ext|x|extension)?\s*\d*',
-        ]
-        
-        # Email pattern
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        
-        for pattern in phone_patterns:
-            phones = re.findall(pattern, text)
+        for pattern in PHONE_RES:
+            phones = pattern.findall(text)
             if phones:
                 contact_info.extend([f"📞 Phone: {phone}" for phone in phones])
         
-        emails = re.findall(email_pattern, text)
+        emails = EMAIL_RE.findall(text)
         if emails:
             contact_info.extend([f"✉️ Email: {email}" for email in emails])
         
         return contact_info
 
-    def crawl(self, max_pages=100):
-        queue = [self.base_url]
-        
-        print(f"🚀 Crawling {self.base_url}")
-        print(f"📊 Max pages: {max_pages}\n")
-
-        while queue and len(self.visited) < max_pages:
-            url = queue.pop(0)
-            url = self.clean_url(url)
+    def parse_page(self, html, url):
+        """Parse one fetched page into (page_data or None, contact_info, links)"""
+        # lxml is a C parser; given raw bytes it picks the encoding itself
+        soup = BeautifulSoup(html, "lxml")
+
+        # Extract main content
+        text = self.extract_text(soup)
+        
+        # Extract contact information specifically
+        contact_info = self.extract_contact_info(text, url)
+        
+        # Only save pages with substantial content
+        page_data = None
+        if len(text) > 200:
+            title = soup.title.string if soup.title else ""
+            page_data = {
+                "url": url,
+                "title": title.strip() if title else "",
+                "content": text,
+                "length": len(text),
+                "contact_info": contact_info,
+                "is_contact_page": any(kw in url.lower() for kw in self.contact_keywords)
+            }
+
+        return page_data, contact_info, self.extract_links(soup, url)
+
+    async def _crawl(self, max_pages):
+        """Breadth-first crawl with CONCURRENCY workers sharing one queue"""
+        queue = asyncio.Queue()
+        queued = {self.base_url}
+        queue.put_nowait(self.base_url)
+        claimed = 0  # Pages being fetched or already visited; caps the crawl at max_pages
+        loop = asyncio.get_running_loop()
+
+        async def worker(session):
+            nonlocal claimed
+            while True:
+                url = await queue.get()
+                try:
+                    if url in self.visited or claimed >= max_pages:
+                        continue
+                    claimed += 1
+                    print(f"📄 [{claimed}/{max_pages}] {url}")
+
+                    html = await self.fetch(session, url)
+                    if html is None:
+                        claimed -= 1
+                        continue
+
+                    self.visited.add(url)
+
+                    # BeautifulSoup is CPU-bound; keep it off the event loop
+                    page_data, contact_info, links = await loop.run_in_executor(
+                        None, self.parse_page, html, url
+                    )
+
+                    if page_data:
+                        self.pages.append(page_data)
+                        
+                        # Print contact info if found
+                        if contact_info:
+                            print(f"   ✅ Found contact info: {contact_info}")
+                        
+                        print(f"   ✅ Content length: {page_data['length']} chars")
+
+                    # Discover new links
+                    new_links = 0
+                    for link in links:
+                        if link not in queued:
+                            queued.add(link)
+                            queue.put_nowait(link)
+                            new_links += 1
+                    
+                    if new_links > 0:
+                        print(f"   🔗 Found {new_links} new links")
 
-            if url in self.visited:
-                continue
+                    await asyncio.sleep(DELAY)  # Polite delay
 
-            try:
-                print(f"📄 [{len(self.visited) + 1}/{max_pages}] {url}")
-                
-                res = self.fetch(url)
-                if not res:
-                    continue
-                    
-                soup = BeautifulSoup(res.text, "html.parser")
-
-                self.visited.add(url)
-
-                # Extract main content
-                text = self.extract_text(soup)
-                
-                # Extract contact information specifically
-                contact_info = self.extract_contact_info(text, url)
-                
-                # Only save pages with substantial content
-                if len(text) > 200:
-                    title = soup.title.string if soup.title else ""
-                    page_data = {
-                        "url": url,
-                        "title": title.strip() if title else "",
-                        "content": text,
-                        "length": len(text),
-                        "contact_info": contact_info,
-                        "is_contact_page": any(kw in url.lower() for kw in self.contact_keywords)
-                    }
-                    self.pages.append(page_data)
-                    
-                    # Print contact info if found
-                    if contact_info:
-                        print(f"   ✅ Found contact info: {contact_info}")
-                    
-                    print(f"   ✅ Content length: {len(text)} chars")
+                except Exception as e:
+                    print(f"❌ Error on {url}: {e}")
+                finally:
+                    queue.task_done()
 
-                # Discover new links
-                links = self.extract_links(soup, url)
-                new_links = 0
-                for link in links:
-                    if link not in self.visited and link not in queue:
-                        queue.append(link)
-                        new_links += 1
-                
-                if new_links > 0:
-                    print(f"   🔗 Found {new_links} new links")
+        connector = aiohttp.TCPConnector(limit_per_host=CONCURRENCY)
+        timeout = aiohttp.ClientTimeout(total=15)
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(CONCURRENCY)]
+            await queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
-                time.sleep(0.5)  # Polite delay
+    def crawl(self, max_pages=100):
+        print(f"🚀 Crawling {self.base_url}")
+        print(f"📊 Max pages: {max_pages}\n")
 
-            except Exception as e:
-                print(f"❌ Error on {url}: {e}")
+        asyncio.run(self._crawl(max_pages))
 
         print(f"\n✅ Crawl complete!")
         print(f"   Visited: {len(self.visited)} pages")
@@ -193,8 +221,8 @@ class PrimisWebsiteScraper:
         os.makedirs("data", exist_ok=True)
         
         # Save full data
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(self.pages, f, indent=2, ensure_ascii=False)
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(self.pages, option=orjson.OPT_INDENT_2))
         
         # Also save a summary for quick verification
         summary = []
@@ -208,8 +236,8 @@ class PrimisWebsiteScraper:
             })
         
         summary_file = "data/scraped_summary.json"
-        with open(summary_file, "w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        with open(summary_file, "wb") as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
         
         print(f"💾 Saved full data to {filename}")
         print(f"📋 Saved summary to {summary_file}")
@@ -0,0 +1,54 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    LRU cache of answers keyed by unit-normalized question embeddings.
+    A lookup hits when a cached question's cosine similarity is at least
+    `threshold` (a dot product, since the vectors are normalized).
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = 0.95, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (vector, answer, stored_at)
+        self._matrix = None  # Stacked vectors, rebuilt after writes
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def get(self, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            key = self._keys[best]
+            _, answer, stored_at = self._entries[key]
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self._matrix = None
+                return None
+
+            self._entries.move_to_end(key)
+            return answer
+
+    def put(self, key, vector, answer):
+        with self._lock:
+            self._entries[key] = (np.asarray(vector, dtype=np.float32), answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._matrix = None
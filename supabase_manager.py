@@ -1,11 +1,84 @@
 import os
+import base64
+import hashlib
+import shutil
+import asyncio
 import logging
+import threading
+import aiohttp
+import requests
 from supabase import create_client, Client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+RESUMABLE_THRESHOLD = 50 << 20  # Larger uploads go through the TUS endpoint
+TUS_CHUNK_SIZE = 6 << 20  # The only chunk size Supabase's TUS endpoint accepts
+TUS_RETRIES = 3  # Consecutive failed chunks before giving up
+
+
+def _preallocate(f, size):
+    """Reserve the file's extent up front so streamed writes don't fragment"""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass  # Filesystem doesn't support it; writes still work
+
+
+def _local_md5(path):
+    """
+    Hex MD5 of a file, the ETag Storage reports for single-part uploads.
+    Kept in a <path>.md5 sidecar keyed on size and mtime so reruns skip rehashing.
+    """
+    stat = os.stat(path)
+    stamp = f"{stat.st_size} {stat.st_mtime_ns}"
+    sidecar = path + ".md5"
+    try:
+        with open(sidecar) as f:
+            cached_stamp, digest = f.read().rsplit(" ", 1)
+        if cached_stamp == stamp:
+            return digest
+    except (OSError, ValueError):
+        pass
+
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    digest = md5.hexdigest()
+
+    try:
+        with open(sidecar, "w") as f:
+            f.write(f"{stamp} {digest}")
+    except OSError:
+        pass
+    return digest
+
+
+def _run_async(coro):
+    """Run a coroutine on uvloop when it is installed"""
+    try:
+        import uvloop
+        return uvloop.run(coro)
+    except ImportError:
+        return asyncio.run(coro)
+
+
 class SupabaseStorageManager:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "SupabaseStorageManager":
+        """Shared manager, so the Supabase client and its connection pool are built once"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
     def __init__(self):
         """Initialize Supabase client"""
         supabase_url = os.getenv("SUPABASE_URL")
@@ -14,95 +87,221 @@ class SupabaseStorageManager:
         if not supabase_url or not supabase_key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
         
+        self.url = supabase_url.rstrip("/")
+        self._headers = {"Authorization": f"Bearer {supabase_key}", "apikey": supabase_key}
+
         try:
             self.client: Client = create_client(supabase_url, supabase_key)
             logger.info("✅ Supabase client initialized")
         except Exception as e:
-            logger.error(f"❌ Failed to initialize Supabase client: {e}")
+            logger.error("❌ Failed to initialize Supabase client: %s", e)
             raise
     
     def download_file(self, remote_path: str, local_path: str, bucket_name: str) -> bool:
         """Download file from Supabase Storage"""
         try:
-            logger.info(f"⬇️  Downloading {remote_path} from bucket {bucket_name}...")
-            
-            # Download file content
-            response = self.client.storage.from_(bucket_name).download(remote_path)
+            logger.info("⬇️  Downloading %s from bucket %s...", remote_path, bucket_name)
             
-            if response is None:
-                logger.error(f"❌ No data received for {remote_path}")
-                return False
-            
-            # Write to local file
+            # Stream straight to disk instead of buffering the whole object
+            url = f"{self.url}/storage/v1/object/{bucket_name}/{remote_path}"
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, 'wb') as f:
-                f.write(response)
+            part_path = local_path + ".part"
+            with requests.get(url, headers=self._headers, stream=True, timeout=(30, 60)) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with open(part_path, 'wb') as f:
+                    _preallocate(f, int(response.headers.get("Content-Length", 0)))
+                    shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+                    f.truncate(f.tell())
+            os.replace(part_path, local_path)
             
             size = os.path.getsize(local_path)
-            logger.info(f"✅ Downloaded {remote_path}: {size:,} bytes")
+            logger.info("✅ Downloaded %s: %d bytes", remote_path, size)
             return True
             
         except Exception as e:
-            logger.error(f"❌ Download failed for {remote_path}: {str(e)}")
+            logger.error("❌ Download failed for %s: %s", remote_path, e)
             return False
     
+    async def _download_async(self, session, remote_path: str, local_path: str, bucket_name: str):
+        """Stream one object from the Storage REST API to disk"""
+        url = f"{self.url}/storage/v1/object/{bucket_name}/{remote_path}"
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        # Stream into a side file so an interrupted transfer never leaves a
+        # truncated index at local_path
+        part_path = local_path + ".part"
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            with open(part_path, 'wb') as f:
+                _preallocate(f, resp.content_length)
+                async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                f.truncate(f.tell())
+        os.replace(part_path, local_path)
+
+        size = os.path.getsize(local_path)
+        logger.info("✅ Downloaded %s: %d bytes", remote_path, size)
+
+    async def _download_files_async(self, files, bucket_name: str) -> bool:
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        connector = aiohttp.TCPConnector(limit=8)
+
+        async with aiohttp.ClientSession(headers=self._headers, timeout=timeout, connector=connector) as session:
+            results = await asyncio.gather(
+                *[self._download_async(session, remote_path, local_path, bucket_name)
+                  for remote_path, local_path in files],
+                return_exceptions=True
+            )
+
+        success = True
+        for (remote_path, _), result in zip(files, results):
+            if isinstance(result, Exception):
+                logger.error("❌ Download failed for %s: %s", remote_path, result)
+                success = False
+        return success
+
+    def download_files(self, files: list, bucket_name: str) -> bool:
+        """Download [(remote_path, local_path), ...] concurrently; True only if all succeed"""
+        try:
+            logger.info("⬇️  Downloading %d files from bucket %s...", len(files), bucket_name)
+            return _run_async(self._download_files_async(files, bucket_name))
+        except Exception as e:
+            logger.error("❌ Download failed: %s", e)
+            return False
+
     def upload_file(self, local_path: str, remote_path: str, bucket_name: str) -> bool:
         """Upload file to Supabase Storage"""
-        try:
-            logger.info(f"⬆️  Uploading {local_path} to {remote_path}...")
-            
-            if not os.path.exists(local_path):
-                logger.error(f"❌ Local file not found: {local_path}")
+        # Same streamed REST upload as upload_files; the body is read from
+        # disk in chunks and never held in memory whole
+        return self.upload_files([(local_path, remote_path)], bucket_name)[0]
+    
+    async def _is_unchanged(self, session, local_path: str, remote_path: str, bucket_name: str) -> bool:
+        """True when the stored object has the local file's size and MD5 ETag"""
+        url = f"{self.url}/storage/v1/object/authenticated/{bucket_name}/{remote_path}"
+        async with session.head(url) as resp:
+            if resp.status != 200:
                 return False
-            
+            etag = resp.headers.get("ETag", "").strip('"')
+            length = resp.content_length
+
+        if length != os.path.getsize(local_path):
+            return False
+        return etag == await asyncio.to_thread(_local_md5, local_path)
+
+    async def _upload_async(self, session, local_path: str, remote_path: str, bucket_name: str,
+                            skip_unchanged: bool = False):
+        """Stream one file to the Storage REST API, overwriting any existing object"""
+        if skip_unchanged and await self._is_unchanged(session, local_path, remote_path, bucket_name):
+            logger.info("⏭️  %s unchanged in storage, skipping upload", local_path)
+            return
+
+        if os.path.getsize(local_path) > RESUMABLE_THRESHOLD:
+            await self._upload_resumable(session, local_path, remote_path, bucket_name)
+        else:
+            url = f"{self.url}/storage/v1/object/{bucket_name}/{remote_path}"
+            headers = {"content-type": "application/octet-stream", "x-upsert": "true"}
+
             with open(local_path, 'rb') as f:
-                file_content = f.read()
-            
-            # Check if file exists and delete if needed (for overwrite)
-            try:
-                self.client.storage.from_(bucket_name).remove([remote_path])
-                logger.info(f"🗑️  Removed existing file: {remote_path}")
-            except:
-                pass  # File might not exist
-            
-            # Upload with proper options
-            self.client.storage.from_(bucket_name).upload(
-                path=remote_path,
-                file=file_content,
-                file_options={"content-type": "application/octet-stream"}
+                async with session.post(url, data=f, headers=headers) as resp:
+                    resp.raise_for_status()
+
+        logger.info("✅ Uploaded %s: %d bytes", local_path, os.path.getsize(local_path))
+
+    async def _upload_resumable(self, session, local_path: str, remote_path: str, bucket_name: str):
+        """
+        Upload through the TUS resumable endpoint in TUS_CHUNK_SIZE pieces.
+        A failed chunk resumes from the offset the server reports instead of
+        restarting the whole file. TUS appends in order, so chunks are sequential.
+        """
+        size = os.path.getsize(local_path)
+        tus = {"tus-resumable": "1.0.0"}
+        metadata = ",".join(
+            f"{key} {base64.b64encode(value.encode()).decode()}"
+            for key, value in (
+                ("bucketName", bucket_name),
+                ("objectName", remote_path),
+                ("contentType", "application/octet-stream"),
             )
-            
-            logger.info(f"✅ Uploaded {local_path}")
-            
-            # Verify upload
-            try:
-                size = len(file_content)
-                logger.info(f"   Size: {size:,} bytes")
-            except:
-                pass
-                
-            return True
-            
+        )
+
+        create_headers = {**tus, "upload-length": str(size), "upload-metadata": metadata, "x-upsert": "true"}
+        async with session.post(f"{self.url}/storage/v1/upload/resumable", headers=create_headers) as resp:
+            resp.raise_for_status()
+            location = resp.headers["Location"]
+
+        offset, failures = 0, 0
+        with open(local_path, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(TUS_CHUNK_SIZE)
+                patch_headers = {
+                    **tus,
+                    "upload-offset": str(offset),
+                    "content-type": "application/offset+octet-stream",
+                }
+                try:
+                    async with session.patch(location, data=chunk, headers=patch_headers) as resp:
+                        resp.raise_for_status()
+                        offset = int(resp.headers["Upload-Offset"])
+                    failures = 0
+                except aiohttp.ClientError as e:
+                    failures += 1
+                    if failures > TUS_RETRIES:
+                        raise
+                    logger.warning("⚠️ Chunk at %d of %s failed, resuming: %s", offset, local_path, e)
+                    async with session.head(location, headers=tus) as resp:
+                        resp.raise_for_status()
+                        offset = int(resp.headers["Upload-Offset"])
+
+    async def _upload_files_async(self, files, bucket_name: str, skip_unchanged: bool) -> list:
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=120)
+        connector = aiohttp.TCPConnector(limit=8)
+
+        async with aiohttp.ClientSession(headers=self._headers, timeout=timeout, connector=connector) as session:
+            results = await asyncio.gather(
+                *[self._upload_async(session, local_path, remote_path, bucket_name, skip_unchanged)
+                  for local_path, remote_path in files],
+                return_exceptions=True
+            )
+
+        flags = []
+        for (local_path, _), result in zip(files, results):
+            if isinstance(result, Exception):
+                logger.error("❌ Upload failed for %s: %s", local_path, result)
+            flags.append(not isinstance(result, Exception))
+        return flags
+
+    def upload_files(self, files: list, bucket_name: str, skip_unchanged: bool = False) -> list:
+        """
+        Upload [(local_path, remote_path), ...] concurrently; returns a success flag per file.
+        With skip_unchanged, files whose stored copy already matches are not re-sent.
+        """
+        if not files:
+            return []
+        try:
+            logger.info("⬆️  Uploading %d files to bucket %s...", len(files), bucket_name)
+            return _run_async(self._upload_files_async(files, bucket_name, skip_unchanged))
         except Exception as e:
-            logger.error(f"❌ Upload failed for {local_path}: {str(e)}")
-            return False
-    
+            logger.error("❌ Upload failed: %s", e)
+            return [False] * len(files)
+
     def list_files(self, bucket_name: str, folder: str = "") -> list:
         """List files in a bucket folder"""
         try:
             files = self.client.storage.from_(bucket_name).list(folder)
-            logger.info(f"📁 Found {len(files)} files in {folder}")
+            logger.info("📁 Found %d files in %s", len(files), folder)
             return files
         except Exception as e:
-            logger.error(f"❌ List files failed: {str(e)}")
+            logger.error("❌ List files failed: %s", e)
             return []
     
     def delete_file(self, remote_path: str, bucket_name: str) -> bool:
         """Delete file from Supabase Storage"""
         try:
             self.client.storage.from_(bucket_name).remove([remote_path])
-            logger.info(f"🗑️  Deleted {remote_path}")
+            logger.info("🗑️  Deleted %s", remote_path)
             return True
         except Exception as e:
-            logger.error(f"❌ Delete failed for {remote_path}: {str(e)}")
+            logger.error("❌ Delete failed for %s: %s", remote_path, e)
             return False
@@ -8,13 +8,12 @@ import rag_engine
 
 print("Testing RAG Engine...\n")
 
-# Load vector store
-rag_engine.load_vectorstore_from_supabase()
+# Load vector store (in the background) and Gemini
+rag_engine.start_loading_vectorstore()
+rag_engine.initialize_gemini()
 
-# Check if loaded (use the correct module-level variable)
-if rag_engine.db is None:
-    print("❌ Vector store failed to load!")
-    print(f"Error: {rag_engine.loading_error}")
+if not rag_engine.wait_for_vectorstore():
+    print("❌ Vector store failed to load! See the log above for the error.")
     exit(1)
 
 print("\n✅ Vector store loaded! Testing queries...\n")
@@ -30,7 +29,7 @@ queries = [
 
 for query in queries:
     print(f"❓ Query: {query}")
-    answer = rag_engine.rag_answer(query)
+    answer = rag_engine.get_answer(query)
     print(f"💬 Answer: {answer}\n")
     print("-" * 70 + "\n")
 
@@ -1,6 +1,6 @@
 import os
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from embeddings import get_embeddings
 from google import genai
 
 # Remove conflicting env var
@@ -12,9 +12,7 @@ def test_rag():
     
     # 1. Load embeddings
     print("📦 Loading embeddings model...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    embeddings = get_embeddings()
     print("✅ Embeddings loaded")
     
     # 2. Load vector store
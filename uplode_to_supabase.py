@@ -12,10 +12,14 @@ def verify_files_exist():
         "vectorstore/index.pkl"
     ]
     
-    missing_files = []
-    for file_path in required_files:
-        if not os.path.exists(file_path):
-            missing_files.append(file_path)
+    # One directory pass gives both existence and size
+    try:
+        with os.scandir("vectorstore") as entries:
+            sizes = {entry.name: entry.stat().st_size for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        sizes = {}
+    
+    missing_files = [p for p in required_files if os.path.basename(p) not in sizes]
     
     if missing_files:
         print("❌ Missing required files:")
@@ -27,7 +31,7 @@ def verify_files_exist():
     # Show file sizes
     print("📊 Local files found:")
     for file_path in required_files:
-        size = os.path.getsize(file_path)
+        size = sizes[os.path.basename(file_path)]
         print(f"   - {file_path}: {size:,} bytes")
     
     return True
@@ -57,10 +61,7 @@ def sync():
     
     # Step 3: Upload
     print("\n📤 Starting sync to Supabase...")
-    storage = SupabaseStorageManager()
-    
-    success_count = 0
-    fail_count = 0
+    storage = SupabaseStorageManager.get()
     
     # Upload main files
     files_to_upload = [
@@ -68,11 +69,9 @@ def sync():
         ("vectorstore/index.pkl", "vectorstore/index.pkl")
     ]
     
-    for local_path, remote_path in files_to_upload:
-        if storage.upload_file(local_path, remote_path, bucket_name):
-            success_count += 1
-        else:
-            fail_count += 1
+    results = storage.upload_files(files_to_upload, bucket_name, skip_unchanged=True)
+    success_count = sum(results)
+    fail_count = len(results) - success_count
     
     # Step 4: Verify upload
     print("\n🔍 Verifying upload...")
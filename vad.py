@@ -0,0 +1,125 @@
+import io
+import os
+import wave
+import logging
+import subprocess
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Silero VAD v5 ONNX export, baked into the image next to the embeddings model
+VAD_MODEL_PATH = os.getenv(
+    "VAD_MODEL_PATH",
+    os.path.join(os.getenv("MODEL_CACHE") or "model_cache", "silero_vad.onnx")
+)
+SAMPLE_RATE = 16000
+WINDOW = 512  # Samples per VAD step at 16 kHz (32 ms)
+CONTEXT = 64  # Trailing samples of the previous window the v5 model expects
+SPEECH_THRESHOLD = 0.5
+SPEECH_PAD = 6  # Windows (~200 ms) kept around speech so word edges aren't clipped
+MAX_SILENCE = 16  # Pauses longer than this many windows (~500 ms) are cut
+
+
+@lru_cache(maxsize=1)
+def _session():
+    """The VAD model, or None when it isn't installed (VAD is then skipped)"""
+    if not os.path.exists(VAD_MODEL_PATH):
+        logger.warning("⚠️ No VAD model at %s, sending audio untrimmed", VAD_MODEL_PATH)
+        return None
+
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = 1  # One small window at a time; threads only add overhead
+    options.inter_op_num_threads = 1
+    session = ort.InferenceSession(VAD_MODEL_PATH, sess_options=options, providers=["CPUExecutionProvider"])
+    logger.info("✅ Silero VAD ready")
+    return session
+
+
+def load_model() -> bool:
+    """Load the VAD model ahead of the first request; False if it isn't installed"""
+    return _session() is not None
+
+
+def _decode(audio_bytes: bytes) -> Optional[np.ndarray]:
+    """Decode any container ffmpeg understands to 16 kHz mono int16 PCM"""
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            input=audio_bytes,
+            capture_output=True,
+            timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("⚠️ Could not decode audio for VAD: %s", e)
+        return None
+
+    if result.returncode != 0:
+        logger.warning("⚠️ ffmpeg could not decode audio for VAD: %.200s", result.stderr.decode(errors="ignore"))
+        return None
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def _speech_windows(session, pcm: np.ndarray) -> np.ndarray:
+    """Indices of the WINDOW-sized steps whose speech probability passes SPEECH_THRESHOLD"""
+    samples = pcm.astype(np.float32) / 32768.0
+    n_windows = len(samples) // WINDOW
+    state = np.zeros((2, 1, 128), dtype=np.float32)
+    sr = np.array(SAMPLE_RATE, dtype=np.int64)
+    context = np.zeros(CONTEXT, dtype=np.float32)
+
+    speech = []
+    for i in range(n_windows):
+        window = samples[i * WINDOW:(i + 1) * WINDOW]
+        x = np.concatenate([context, window])[np.newaxis, :]
+        prob, state = session.run(None, {"input": x, "state": state, "sr": sr})
+        context = window[-CONTEXT:]
+        if prob[0][0] >= SPEECH_THRESHOLD:
+            speech.append(i)
+    return np.asarray(speech, dtype=np.int64)
+
+
+def _to_wav(pcm: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def trim_silence(audio_bytes: bytes, mime_type: str):
+    """
+    Cut leading, trailing and long internal silences from an utterance.
+    Returns (audio, mime_type): speech-only 16 kHz WAV, b"" when there is
+    no speech at all, or the input unchanged if the model or ffmpeg is
+    unavailable or the audio can't be decoded.
+    """
+    session = _session()
+    if session is None:
+        return audio_bytes, mime_type
+    pcm = _decode(audio_bytes)
+    if pcm is None:
+        return audio_bytes, mime_type
+
+    speech = _speech_windows(session, pcm)
+    if not len(speech):
+        return b"", mime_type
+
+    # Group speech windows separated by short pauses, pad each group, keep only those spans
+    breaks = np.flatnonzero(np.diff(speech) > MAX_SILENCE)
+    starts = np.concatenate([speech[:1], speech[breaks + 1]])
+    ends = np.concatenate([speech[breaks], speech[-1:]])
+    spans = [
+        pcm[max(0, start - SPEECH_PAD) * WINDOW:(end + 1 + SPEECH_PAD) * WINDOW]
+        for start, end in zip(starts, ends)
+    ]
+    trimmed = np.concatenate(spans)
+    logger.info("✂️ VAD kept %.1fs of %.1fs audio", len(trimmed) / SAMPLE_RATE, len(pcm) / SAMPLE_RATE)
+    return _to_wav(trimmed), "audio/wav"
@@ -0,0 +1,141 @@
+import os
+import sys
+import logging
+
+import faiss
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from mmap_docstore import file_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# HNSW graph parameters
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 32
+IVF_NPROBE = 8
+
+# Vector storage inside the HNSW graph: "8bit" (SQ8) reads a quarter of the
+# bytes per distance; unit-normalized MiniLM vectors keep their ranking
+# under per-dimension 8-bit ranges. "fp16" halves them with no loss at all
+HNSW_STORAGE = os.getenv("HNSW_STORAGE", "8bit")  # "flat", "fp16" or "8bit"
+_SQ_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "8bit": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Map index files instead of reading them into RAM; IO_FLAG_MMAP_IFC
+# extends this to flat indexes on faiss builds that support it
+FAISS_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+# Embeddings are unit-normalized, so inner product ranks exactly like L2
+# while skipping the subtract-and-square in the distance kernel
+DISTANCE_STRATEGY = DistanceStrategy.MAX_INNER_PRODUCT
+
+
+def read_index_mmap(path):
+    """Read an index memory-mapped, falling back to a full read for unsupported types"""
+    try:
+        return faiss.read_index(path, FAISS_MMAP_FLAGS)
+    except RuntimeError as e:
+        logger.warning("⚠️ mmap load not supported for %s, reading fully: %s", path, e)
+        return faiss.read_index(path)
+
+
+def distance_strategy_for(index):
+    """LangChain distance strategy matching a loaded index's metric"""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return DistanceStrategy.MAX_INNER_PRODUCT
+    return DistanceStrategy.EUCLIDEAN_DISTANCE
+
+
+def to_hnsw(index, metric=None):
+    """
+    Rebuild a flat index as an HNSW index with HNSW_STORAGE vectors
+    (same vectors, same metric unless given)
+    """
+    metric = index.metric_type if metric is None else metric
+    if isinstance(index, faiss.IndexHNSW) and index.metric_type == metric:
+        return index
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if HNSW_STORAGE in _SQ_TYPES:
+        hnsw = faiss.IndexHNSWSQ(index.d, _SQ_TYPES[HNSW_STORAGE], HNSW_M, metric)
+        hnsw.train(vectors)
+    else:
+        hnsw = faiss.IndexHNSWFlat(index.d, HNSW_M, metric)
+    hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    hnsw.add(vectors)
+    logger.info("🕸️  Built HNSW index: %d vectors, M=%d, %s storage", hnsw.ntotal, HNSW_M, HNSW_STORAGE)
+    return hnsw
+
+
+def hnsw_cache_file(index_file):
+    """Where load_or_build_hnsw keeps the converted copy of index_file"""
+    return f"{index_file}.hnsw-{HNSW_STORAGE}"
+
+
+def load_or_build_hnsw(index_file, index):
+    """
+    HNSW version of a flat index loaded from index_file.
+    The converted index is cached next to it, keyed on the source file's hash.
+    """
+    cache_file = hnsw_cache_file(index_file)
+    stamp_file = cache_file + ".xxh"
+    source_hash = file_hash(index_file)
+
+    try:
+        with open(stamp_file) as f:
+            if f.read().strip() == source_hash:
+                logger.info("🕸️  Using cached HNSW index %s", cache_file)
+                return read_index_mmap(cache_file)
+    except (OSError, RuntimeError):
+        pass
+
+    hnsw = to_hnsw(index)
+    try:
+        faiss.write_index(hnsw, cache_file)
+        with open(stamp_file, "w") as f:
+            f.write(source_hash)
+    except (OSError, RuntimeError) as e:
+        logger.warning("⚠️ Could not cache HNSW index: %s", e)
+    return hnsw
+
+
+def prefault(path, chunk_size=1 << 20):
+    """Read a file once so its pages are in the page cache before the first search"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while f.read(chunk_size):
+            pass
+
+
+def tune_for_search(index):
+    """Apply query-time search parameters to a loaded index"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+
+
+def to_similarity(index, score):
+    """Cosine similarity from a raw FAISS score over unit-normalized vectors"""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return score
+    return 1 - score / 2  # Squared L2 distance = 2 - 2cos
+
+
+def convert_saved_index(path):
+    """Convert a saved index.faiss to an inner-product HNSW index in place"""
+    index_file = os.path.join(path, "index.faiss")
+    index = faiss.read_index(index_file)
+    faiss.write_index(to_hnsw(index, faiss.METRIC_INNER_PRODUCT), index_file)
+    logger.info("✅ Rewrote %s", index_file)
+
+
+if __name__ == "__main__":
+    convert_saved_index(sys.argv[1] if len(sys.argv) > 1 else "vectorstore")
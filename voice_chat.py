@@ -1,13 +1,20 @@
-import os, uuid
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, Response as FastAPIResponse
-from fastapi.responses import Response
+import os
+import asyncio
+import hashlib
+import re
+import uuid_utils
+from cachetools import LRUCache
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, Form, HTTPException, Request, Response as FastAPIResponse
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import SessionLocal, save_rows
 from models import Chat
 from google import genai
 from google.genai import types
 from google.cloud import texttospeech
-from rag_engine import get_answer  # Import RAG engine
+import rag_engine
+from vad import trim_silence, load_model as load_vad_model
+from rag_engine import aget_answer, GEMINI_MODEL  # Import RAG engine
 from datetime import datetime
 import logging
 import traceback
@@ -22,6 +29,67 @@ def get_db():
     finally:
         db.close()
 
+# Shared TTS audio cache directory (e.g. a mounted volume) so synthesized answers
+# survive restarts and are shared by workers; unset keeps only the in-process cache
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+
+# Uploads are spooled to disk by Starlette. Short clips go inline, where the
+# saved Files API round trip outweighs base64-encoding them on the event loop;
+# anything larger is uploaded to the Files API and referenced by URI
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", 25 * 1024 * 1024))
+INLINE_AUDIO_BYTES = 1024 * 1024
+
+# Voice requests a single caller may run at once; extra ones wait their turn
+# instead of piling onto the Gemini and TTS quotas
+VOICE_MAX_CONCURRENCY_PER_USER = int(os.getenv("VOICE_MAX_CONCURRENCY_PER_USER", "3"))
+
+# Audio types accepted for transcription; Chrome's MediaRecorder may label webm as video
+_AUDIO_TYPES = ("audio/", "video/webm")
+
+_TRANSCRIBE_PROMPT = "Transcribe this audio exactly as spoken. Only return the transcription text, nothing else."
+
+# Answers are synthesized in segments of whole sentences up to this size, so
+# the first audio goes out after one short synthesis instead of the full text
+TTS_SEGMENT_CHARS = 400
+TTS_CONCURRENCY = 4  # Segments synthesized at once per answer
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD_CHAR = re.compile(r"\w")
+
+# TTS request settings, built once rather than per synthesis
+_TTS_VOICE = texttospeech.VoiceSelectionParams(
+    language_code="en-US",
+    name="en-US-Neural2-F",  # Female voice
+    ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
+)
+# Output formats by name: (audio config, media type, file extension, segmented).
+# MP3 is the default; clients that send "Accept: audio/ogg" get Opus at about
+# half the bytes. MP3 frames concatenate, so MP3 is synthesized and streamed in
+# segments; each Ogg synthesis is a complete stream and players stop at the
+# end of the first, so Ogg answers are synthesized in one call.
+_TTS_FORMATS = {
+    "mp3": (
+        texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3,
+            speaking_rate=1.0,
+            pitch=0.0
+        ),
+        "audio/mpeg",
+        "mp3",
+        True
+    ),
+    "ogg": (
+        texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.OGG_OPUS,
+            sample_rate_hertz=24000,
+            speaking_rate=1.0,
+            pitch=0.0
+        ),
+        "audio/ogg",
+        "ogg",
+        False
+    ),
+}
+
 # Lazy client initialization
 _gemini_client = None
 _tts_client = None
@@ -29,6 +97,9 @@ _tts_client = None
 def get_gemini_client():
     """Get or create Gemini client for transcription"""
     global _gemini_client
+    if _gemini_client is None and rag_engine.gemini_client is not None:
+        # Share the answer client (and its connection pool) set up at startup
+        _gemini_client = rag_engine.gemini_client
     if _gemini_client is None:
         # Remove GOOGLE_API_KEY to avoid conflicts
         if "GOOGLE_API_KEY" in os.environ:
@@ -43,7 +114,7 @@ def get_gemini_client():
     return _gemini_client
 
 def get_tts_client():
-    """Get or create Text-to-Speech client"""
+    """Get or create the async Text-to-Speech client (call from the event loop)"""
     global _tts_client
     if _tts_client is None:
         try:
@@ -55,71 +126,255 @@ def get_tts_client():
             else:
                 logger.warning("⚠️ No Google Cloud credentials found - TTS may not work")
             
-            _tts_client = texttospeech.TextToSpeechClient()
+            # One grpc.aio channel shared by every request, awaited natively
+            _tts_client = texttospeech.TextToSpeechAsyncClient()
             logger.info("✅ Text-to-Speech client initialized")
         except Exception as e:
-            logger.error(f"❌ Failed to initialize TTS client: {str(e)}")
+            logger.error("❌ Failed to initialize TTS client: %s", e)
             logger.error(traceback.format_exc())
             # Don't raise - let it return None so fallback works
             logger.warning("⚠️ TTS will be disabled - using text-only responses")
             _tts_client = None
     return _tts_client
 
-def text_to_speech(text: str) -> bytes:
-    """Convert text to speech audio using Google Cloud TTS"""
+async def warm_up_voice():
+    """
+    Build the transcription and TTS clients and load the VAD model before the
+    first voice request. list_voices is a free RPC that opens the TTS gRPC
+    channel and fetches credentials. The canned greeting reply is synthesized
+    into the cache, so greetings are answered without any model round trip.
+    """
     try:
-        logger.info(f"🔊 Generating TTS for text: {text[:100]}...")
+        get_gemini_client()
+        client = get_tts_client()
+        if client is not None:
+            await client.list_voices(language_code="en-US")
+            for segment in _speech_segments(rag_engine.GREETING_RESPONSE):
+                await _synthesize(segment)
+        await asyncio.to_thread(load_vad_model)
+        logger.info("🔥 Voice clients warmed")
+    except Exception as e:
+        logger.warning("⚠️ Voice warm-up failed: %s", e)
+
+# Most recent audio by (format, text); repeated and canned answers skip the TTS round trip.
+# Only touched from the event loop, and failures are never stored.
+_tts_cache = LRUCache(maxsize=128)
+
+def _disk_cache_file(text: str, audio_format: str) -> str:
+    key = hashlib.sha256(f"{_TTS_VOICE.name}\0{text}".encode("utf-8")).hexdigest()
+    return os.path.join(TTS_CACHE_DIR, f"{key}.{_TTS_FORMATS[audio_format][2]}")
+
+def _read_disk_cache(cache_file: str):
+    try:
+        with open(cache_file, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_disk_cache(cache_file: str, audio: bytes):
+    try:
+        os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+        # Write then rename, so other workers never read a partial file
+        part_file = f"{cache_file}.{os.getpid()}.part"
+        with open(part_file, "wb") as f:
+            f.write(audio)
+        os.replace(part_file, cache_file)
+    except OSError as e:
+        logger.warning("⚠️ Could not cache TTS audio: %s", e)
+
+async def _synthesize(text: str, audio_format: str = "mp3") -> bytes:
+    audio = _tts_cache.get((audio_format, text))
+    if audio is not None:
+        return audio
+
+    cache_file = _disk_cache_file(text, audio_format) if TTS_CACHE_DIR else None
+    if cache_file:
+        audio = await asyncio.to_thread(_read_disk_cache, cache_file)
+
+    if audio is None:
         client = get_tts_client()
-        
-        # If client initialization failed, return None
         if client is None:
-            logger.warning("⚠️ TTS client not available - returning None")
-            return None
+            raise RuntimeError("TTS client not available")
+
+        # Generate speech
+        response = await client.synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=_TTS_VOICE,
+            audio_config=_TTS_FORMATS[audio_format][0]
+        )
+        audio = response.audio_content
+
+        if cache_file:
+            await asyncio.to_thread(_write_disk_cache, cache_file, audio)
+
+    _tts_cache[(audio_format, text)] = audio
+    return audio
+
+def _speech_segments(text: str) -> list:
+    """Split text on sentence ends and pack the sentences into segments of up to TTS_SEGMENT_CHARS"""
+    segments, current = [], ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if current and len(current) + len(sentence) + 1 > TTS_SEGMENT_CHARS:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+async def text_to_speech(text: str, audio_format: str = "mp3"):
+    """
+    Convert text to speech audio using Google Cloud TTS.
+    Segments (the whole text for unsegmented formats) are synthesized up to
+    TTS_CONCURRENCY at a time and returned as an async iterator of audio chunks
+    in order, with the first one already done; returns None if TTS fails
+    before any audio exists.
+    """
+    tasks = []
+    try:
+        logger.info("🔊 Generating TTS for text: %.100s...", text)
         
-        # Truncate text if too long (TTS has limits)
+        # Truncate text if too long (one TTS request takes at most 5000 bytes)
         max_chars = 5000
         if len(text) > max_chars:
-            text = text[:max_chars] + "..."
-            logger.warning(f"⚠️ Text truncated to {max_chars} characters for TTS")
-        
-        # Configure synthesis input
-        synthesis_input = texttospeech.SynthesisInput(text=text)
+            text = text[:max_chars - 3] + "..."
+            logger.warning("⚠️ Text truncated to %d characters for TTS", max_chars)
         
-        # Configure voice parameters
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="en-US",
-            name="en-US-Neural2-F",  # Female voice
-            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
-        )
-        
-        # Configure audio settings
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0,
-            pitch=0.0
-        )
-        
-        # Generate speech
-        response = client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
-        
-        logger.info(f"✅ TTS generated successfully, size: {len(response.audio_content)} bytes")
-        return response.audio_content
+        segments = _speech_segments(text) if _TTS_FORMATS[audio_format][3] else [text.strip()]
+        if not segments or not segments[0]:
+            return None
+
+        sem = asyncio.Semaphore(TTS_CONCURRENCY)
+
+        async def one(segment):
+            async with sem:
+                return await _synthesize(segment, audio_format)
+
+        # Started in order, so the semaphore admits the earliest segments first
+        tasks = [asyncio.create_task(one(segment)) for segment in segments]
+        first = await tasks[0]
         
     except Exception as e:
-        logger.error(f"❌ TTS error: {str(e)}")
+        for task in tasks:
+            task.cancel()
+        logger.error("❌ TTS error: %s", e)
         logger.error(traceback.format_exc())
         # Fallback: return None if TTS fails
         return None
 
+    async def chunks():
+        # Only MP3 is segmented (its frames concatenate), so each segment is sent as
+        # soon as it exists; Ogg answers arrive as a single chunk
+        try:
+            yield first
+            for task in tasks[1:]:
+                try:
+                    yield await task
+                except Exception as e:
+                    logger.error("❌ TTS error mid-stream, ending audio early: %s", e)
+                    return
+            logger.info("✅ TTS streamed in %d segments", len(segments))
+        finally:
+            # Client gone or a segment failed: drop the remaining syntheses
+            for task in tasks:
+                task.cancel()
+
+    return chunks()
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+    return size
+
+async def _audio_part(client, file: UploadFile, size: int, background_tasks: BackgroundTasks):
+    """
+    Audio content for the transcription call, or None if it holds no speech.
+    Small clips are trimmed to their speech and sent inline; larger ones are
+    uploaded from the spooled file so their bytes never sit on the heap, and
+    the upload is deleted once the response is sent.
+    """
+    mime_type = file.content_type or "audio/webm"
+    if size <= INLINE_AUDIO_BYTES:
+        audio_bytes = await file.read()
+        trimmed, trimmed_type = await asyncio.to_thread(trim_silence, audio_bytes, mime_type)
+        if not trimmed:
+            return None
+        if len(trimmed) <= INLINE_AUDIO_BYTES:  # PCM can outgrow a long compressed clip
+            audio_bytes, mime_type = trimmed, trimmed_type
+        return types.Part.from_bytes(data=audio_bytes, mime_type=mime_type)
+
+    file.file.seek(0)
+    uploaded = await client.aio.files.upload(
+        file=file.file,
+        config=types.UploadFileConfig(mime_type=mime_type)
+    )
+    background_tasks.add_task(client.aio.files.delete, name=uploaded.name)
+    return uploaded
+
+# Caller -> [semaphore, requests holding or waiting on it]; entries are
+# dropped when idle so the dict doesn't grow with every caller ever seen
+_user_slots = {}
+
+def _caller_key(request: Request, user_id: str) -> str:
+    """Who to throttle: the user_id when one is sent, else the session or client address"""
+    if user_id != "default_user":
+        return f"user:{user_id}"
+    session_id = request.cookies.get("session_id")
+    if session_id:
+        return f"session:{session_id}"
+    forwarded = request.headers.get("x-forwarded-for")  # Cloud Run's front end
+    host = forwarded.split(",")[0].strip() if forwarded else (request.client.host if request.client else "")
+    return f"ip:{host}"
+
+class _UserSlot:
+    """One request's hold on its caller's concurrency slot; release() may be called more than once"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self._held = False
+
+    async def acquire(self):
+        slot = _user_slots.setdefault(self.key, [asyncio.Semaphore(VOICE_MAX_CONCURRENCY_PER_USER), 0])
+        slot[1] += 1
+        try:
+            await slot[0].acquire()
+        except BaseException:
+            self._leave(slot)
+            raise
+        self._held = True
+
+    def release(self):
+        if not self._held:
+            return
+        self._held = False
+        slot = _user_slots[self.key]
+        slot[0].release()
+        self._leave(slot)
+
+    def _leave(self, slot):
+        slot[1] -= 1
+        if not slot[1]:
+            del _user_slots[self.key]
+
+async def _release_when_done(chunks, slot: _UserSlot):
+    """Pass a streamed body through, holding the slot until the last chunk is sent or the client leaves"""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        try:
+            await chunks.aclose()  # Cancels outstanding TTS segments
+        finally:
+            slot.release()
+
 # SESSION HANDLER (same as in chat.py)
 def get_or_create_session(request: Request, response: FastAPIResponse):
     session_id = request.cookies.get("session_id")
     if not session_id:
-        session_id = str(uuid.uuid4())
+        session_id = str(uuid_utils.uuid7())  # Time-ordered, so new sessions append to the index
         response.set_cookie(
             key="session_id",
             value=session_id,
@@ -133,6 +388,7 @@ def get_or_create_session(request: Request, response: FastAPIResponse):
 async def voice_chat(
     request: Request,
     response: FastAPIResponse,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     user_id: str = Form("default_user"),
     response_format: str = Form("json"),  # "json" or "audio"
@@ -148,53 +404,87 @@ async def voice_chat(
     
     Returns:
     - JSON with transcription and text response (if response_format=json)
-    - MP3 audio file (if response_format=audio)
+    - MP3 audio file (if response_format=audio), or Ogg Opus with Accept: audio/ogg
     
     Features:
     - Uses RAG to answer from Primis Digital knowledge base
     - Supports session-based conversation history
     - Text-to-Speech for audio responses
     """
-    logger.info(f"📞 Voice chat request from user: {user_id}, format: {response_format}")
+    slot = _UserSlot(_caller_key(request, user_id))
+    await slot.acquire()
+    # Background tasks run once the response is sent, after the last audio
+    # chunk for streams; the body wrapper below also covers disconnects
+    background_tasks.add_task(slot.release)
+    try:
+        result = await _voice_chat(request, response, background_tasks, file, user_id, response_format, db)
+    except BaseException:
+        slot.release()  # Errors skip the background tasks
+        raise
+
+    if isinstance(result, StreamingResponse):
+        result.body_iterator = _release_when_done(result.body_iterator, slot)
+    return result
+
+async def _voice_chat(request, response, background_tasks, file, user_id, response_format, db):
+    logger.info("📞 Voice chat request from user: %s, format: %s", user_id, response_format)
     
     try:
-        audio_bytes = await file.read()
-        logger.info(f"📁 Received audio file: {file.filename}, size: {len(audio_bytes)} bytes, type: {file.content_type}")
+        audio_size = _upload_size(file)
+        logger.info("📁 Received audio file: %s, size: %d bytes, type: %s", file.filename, audio_size, file.content_type)
+        if audio_size > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail=f"Audio file exceeds {MAX_AUDIO_BYTES} bytes")
+        if file.content_type and not file.content_type.startswith(_AUDIO_TYPES):
+            raise HTTPException(status_code=415, detail=f"Unsupported audio type: {file.content_type}")
         
         # Get or create session
         session_id = get_or_create_session(request, response)
-        logger.info(f"🔑 Session ID: {session_id}")
+        logger.info("🔑 Session ID: %s", session_id)
         
         # Step 1: Transcribe audio using Gemini
         logger.info("🎤 Transcribing audio...")
         client = get_gemini_client()
         
+        audio_part = await _audio_part(client, file, audio_size, background_tasks)
+        if audio_part is None:
+            logger.info("🔇 No speech detected, skipping transcription")
+            return {
+                "user_said": "",
+                "message": "No speech detected",
+                "session_id": session_id,
+                "status": "success"
+            }
+        
         # Use Gemini to transcribe the audio
-        transcription_res = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                "Transcribe this audio exactly as spoken. Only return the transcription text, nothing else.",
-                types.Part.from_bytes(data=audio_bytes, mime_type=file.content_type or "audio/webm")
-            ]
+        transcription_res = await client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[_TRANSCRIBE_PROMPT, audio_part]
         )
         
-        user_text = transcription_res.text.strip()
-        logger.info(f"✅ Transcription: {user_text}")
+        user_text = (transcription_res.text or "").strip()
+        logger.info("✅ Transcription: %s", user_text)
         
-        if not user_text:
-            raise ValueError("Transcription failed - no text returned")
+        # Noise or a lone sound: ask again instead of running retrieval and Gemini on it
+        if len(user_text) < 2 or not _WORD_CHAR.search(user_text):
+            logger.info("🔇 Empty transcription, skipping RAG")
+            return {
+                "user_said": user_text,
+                "message": "I didn't catch that, could you repeat?",
+                "session_id": session_id,
+                "status": "success"
+            }
         
         # Step 2: Use RAG to get answer (same as text chat)
         logger.info("🤖 Getting RAG answer...")
-        ai_text = get_answer(
+        ai_text = await aget_answer(
             question=user_text,
             session_id=session_id,
             db_session=db
         )
-        logger.info(f"✅ RAG answer: {ai_text[:100]}...")
+        logger.info("✅ RAG answer: %.100s...", ai_text)
 
-        # Step 3: Save to DB
-        logger.info("💾 Saving to database...")
+        # Step 3: Save to DB once the response is sent, off the request's latency
+        logger.info("💾 Scheduling database save...")
         new_chat = Chat(
             user_id=user_id, 
             session_id=session_id,  # Use actual session ID instead of "voice_session"
@@ -202,27 +492,26 @@ async def voice_chat(
             answer=ai_text,
             created_at=datetime.utcnow()
         )
-        db.add(new_chat)
-        db.commit()
-        db.refresh(new_chat)
-        logger.info(f"✅ Chat saved with ID: {new_chat.id}")
+        background_tasks.add_task(save_rows, new_chat)
 
         # Step 4: Return based on format
         if response_format == "audio":
             logger.info("🔊 Generating audio response...")
-            # Generate TTS audio
-            audio_content = text_to_speech(ai_text)
+            audio_format = "ogg" if "audio/ogg" in request.headers.get("accept", "") else "mp3"
+            _, media_type, extension, _ = _TTS_FORMATS[audio_format]
+            audio_stream = await text_to_speech(ai_text, audio_format)
             
-            if audio_content:
-                logger.info("✅ Returning audio response")
-                return Response(
-                    content=audio_content,
-                    media_type="audio/mpeg",
-                    headers={
-                        "Content-Disposition": "attachment; filename=response.mp3",
-                        "Content-Length": str(len(audio_content))
-                    }
+            if audio_stream is not None:
+                logger.info("✅ Streaming audio response")
+                streaming = StreamingResponse(
+                    audio_stream,
+                    media_type=media_type,
+                    headers={"Content-Disposition": f"attachment; filename=response.{extension}"}
                 )
+                # A returned response doesn't inherit the injected one's cookie
+                if "set-cookie" in response.headers:
+                    streaming.headers["set-cookie"] = response.headers["set-cookie"]
+                return streaming
             else:
                 # Fallback to JSON if TTS fails
                 logger.warning("⚠️ TTS failed, returning JSON response")
@@ -243,8 +532,10 @@ async def voice_chat(
                 "status": "success"
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"❌ Voice chat error: {str(e)}")
+        logger.error("❌ Voice chat error: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Voice chat failed: {str(e)}")
 